@@ -1,11 +1,23 @@
+import time
+
+# Start of the clock for --startup-timings
+LAUNCHED = time.perf_counter()
+
 import customtkinter as ctk
-from tkinter import simpledialog, messagebox, filedialog, Menu
-import pygame
+from tkinter import simpledialog, messagebox, filedialog, Menu, PhotoImage
 import os
-import json
-
-# Initialize pygame mixer
-pygame.mixer.init()
+import math
+import argparse
+from effects import START, END, FADE_IN, FADE_OUT, SPEED, PITCH, EFFECTS
+from engine import SoundBoardEngine, AUDIO_FREQUENCY, AUDIO_BUFFER, AUDIO_CHANNELS
+from hotkeys import GLOBAL_BANK, BANK_PREFIX
+from importer import ImportJob
+from metrics import METRICS, MetricsExporter, FORMATS, JSON, DEFAULT_EXPORT_INTERVAL, parse_address
+from store import DEFAULT_BOARD
+from peaks import waveform_png
+from streaming import AUTO, RESIDENT, STREAM
+from tile_grid import TileGrid
+from voice_engine import POLICIES, CHOKE, DEFAULT_MAX_VOICES, STEAL_OLDEST, STEAL_POLICIES
 
 # Define your color palette (Black and Yellow Theme)
 PRIMARY_COLOR = "#FFD700"
@@ -18,27 +30,70 @@ ADD_TILE_HOVER = "#555555" # Slightly lighter gray hover
 TILE_BG = "#2C2C2C"        # Medium Dark Gray for tiles
 TILE_TEXT = "#EEEEEE"      # Light Gray for tile text
 
+# How often a running folder import is checked for new tiles
+IMPORT_POLL_MS = 50
+
+# Lowest and highest volume trim the dialog accepts, in dB
+MIN_TRIM_DB = -60.0
+MAX_TRIM_DB = 24.0
+
+# How long a message stays in the status line
+STATUS_MS = 5000
+# The event loop is expected to run a timer this often; any delay is lag
+LAG_PROBE_MS = 100
+OVERLAY_REFRESH_MS = 500
+# Timers shown in the metrics overlay, in order
+OVERLAY_TIMERS = ("trigger", "decode", "render_effects", "regrid", "resize", "event_loop_lag")
+
+# Labels for the "Playback Source" menu
+PLAYBACK_SOURCES = ((AUTO, "Auto (by length)"), (RESIDENT, "Load Into Memory"), (STREAM, "Stream From Disk"))
+
+# Labels and prompts for the "Effects" menu
+EFFECT_PROMPTS = (
+    (FADE_IN, "Fade In", "fade-in length in seconds"),
+    (FADE_OUT, "Fade Out", "fade-out length in seconds"),
+    (START, "Trim Start", "seconds to cut from the start"),
+    (END, "Trim End", "seconds to cut from the end"),
+    (SPEED, "Speed", "playback speed (1 for normal; also shifts the pitch)"),
+    (PITCH, "Pitch", "pitch shift in semitones (also changes the speed)"),
+)
+
+def metrics_text(stats):
+    """Formats engine stats for the metrics overlay."""
+    timers = stats["metrics"]["timers"]
+    counters = stats["metrics"]["counters"]
+    lines = []
+    for name in OVERLAY_TIMERS:
+        summary = timers.get(name, {})
+        if "p95_ms" in summary:
+            lines.append(f"{name:<15} p95 {summary['p95_ms']:7.2f} ms  max {summary['max_ms']:7.2f} ms")
+        else:
+            lines.append(f"{name:<15} -")
+    voices = stats["voices"] or {}
+    lines.append(f"voices          {voices.get('active_voices', 0)}/{voices.get('max_voices', 0)}  peak {voices.get('peak_voices', 0)}  steals {voices.get('steals', 0)}")
+    lines.append(f"cache           hits {stats['cache']['hits']}  misses {stats['cache']['misses']}  variants {stats['variants']['hits']}/{stats['variants']['misses']}")
+    lines.append(f"stream          read-ahead misses {stats['stream']['misses']}")
+    lines.append(f"late triggers   {counters.get('late_triggers', 0)}  errors {counters.get('errors', 0)}")
+    return "\n".join(lines)
+
+
 class SoundBoardApp:
-    def __init__(self, root):
+    def __init__(self, root, engine=None):
         self.root = root
         self.root.title("Virtual Soundboard")
 
-        # Set default window size and make it resizable
-        self.root.geometry("600x400")
+        # The engine owns the sounds, key bindings and playback; this class is only the view.
+        # Its audio device is opened in finish_startup(), after the first frame
+        self.engine = engine if engine is not None else SoundBoardEngine(defer_audio=True)
+        self.engine.error_handlers.append(self.show_engine_error)
+
+        # Reopen at the last session's size so the first frame is already laid out, and keep it resizable
+        layout = self.engine.store.load_layout()
+        self.root.geometry(layout.get("geometry", "600x400"))
         self.root.resizable(True, True)
         self.root.configure(bg=SECONDARY_COLOR)
-
-        # Load existing sounds and key bindings
-        self.sound_buttons_data = self.load_data("sounds.json")
-        self.key_bindings = self.load_data("key_bindings.json")
-        self.tile_widgets = {}
-
-        # Frame for tiles with grid layout
-        self.tile_frame = ctk.CTkFrame(root, fg_color=SECONDARY_COLOR)
-        self.tile_frame.pack(pady=10, padx=20, fill="both", expand=True)
-        self.tile_frame.grid_columnconfigure(list(range(6)), weight=1)
-        self.tile_row = 0
-        self.tile_col = 0
+        if layout.get("board") in self.engine.boards():
+            self.engine.switch_board(layout["board"], preload=False)
         self.num_columns = 6
 
         # Style for the "New" tile
@@ -59,39 +114,40 @@ class SoundBoardApp:
             "height": 70
         }
 
-        # Create "Add New Tile" button
-        self.add_new_tile_button = ctk.CTkButton(
-            self.tile_frame,
-            text="New",
-            compound="top",
-            font=ctk.CTkFont(size=12, weight="bold"),
-            **self.new_tile_style,
-            command=self.prompt_add_sound
+        # Scrollable tile grid; only the visible rows have widgets
+        self.tile_grid = TileGrid(
+            root,
+            self.sound_buttons_data,
+            self.num_columns,
+            self.tile_style,
+            self.new_tile_style,
+            SECONDARY_COLOR,
+            TEXT_COLOR,
+            key_text=self.key_label_text,
+            on_trigger=self.trigger_tile,
+            on_context_menu=self.show_context_menu,
+            on_new=self.prompt_add_sound,
+            on_new_context_menu=self.show_context_menu_new_tile,
+            waveform=self.tile_waveform,
         )
-        self.add_new_tile_button.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
-        self.new_tile_key_label = ctk.CTkLabel(self.tile_frame, text="", text_color=TEXT_COLOR, font=ctk.CTkFont(size=10))
-        self.new_tile_key_label.grid(row=1, column=0, padx=5, pady=(0, 5), sticky="ew")
+        self.tile_grid.pack(pady=10, padx=20, fill="both", expand=True)
+        self.add_new_tile_button = self.tile_grid.new_button
+        self.new_tile_key_label = self.tile_grid.new_label
         self.update_new_tile_key_display()
-        self.update_new_tile_interaction() # Bind right-click for the 'New' tile
-
-        self.tile_row = 0
-        self.tile_col = 1
-
-        # Create existing sound tiles
-        first_tile = True
-        for original_name, path in self.sound_buttons_data.items():
-            name = "New" if first_tile else original_name
-            new_tile = self.create_sound_tile(name, path, self.tile_style)
-            self.tile_widgets[name] = new_tile
-            if first_tile:
-                first_tile = False
-            self.tile_col += 1
-            if self.tile_col >= self.num_columns:
-                self.tile_col = 0
-                self.tile_row += 2
-                self.add_new_tile_button.grid(row=self.tile_row, column=0, padx=5, pady=5, sticky="nsew")
-                self.new_tile_key_label.grid(row=self.tile_row + 1, column=0, padx=5, pady=(0, 5), sticky="ew")
-                self.tile_col = 1
+        self.engine.peak_handlers.append(self.show_waveforms)
+
+        # Board selector; each board has its own tiles, bindings and banks
+        self.board_menu = ctk.CTkOptionMenu(root, values=self.engine.boards(), command=self.on_board_selected, fg_color=TILE_BG, button_color=ADD_TILE_BG, button_hover_color=ADD_TILE_HOVER, text_color=TEXT_COLOR)
+        self.board_menu.set(self.engine.board)
+        self.board_menu.pack(pady=(0, 5), padx=20, anchor="w")
+        self.engine.board_handlers.append(self.on_board_switched)
+
+        # Bank selector; the same keys can trigger different tiles per bank
+        self.bank_menu = ctk.CTkOptionMenu(root, values=self.bank_choices(), command=self.on_bank_selected, fg_color=TILE_BG, button_color=ADD_TILE_BG, button_hover_color=ADD_TILE_HOVER, text_color=TEXT_COLOR)
+        self.bank_menu.pack(pady=(0, 5), padx=20, anchor="w")
+        self.engine.bank_handlers.append(self.on_bank_switched)
+        if layout.get("bank") in self.engine.banks():
+            self.engine.switch_bank(layout["bank"])
 
         # Volume control
         volume_style = {"fg_color": SECONDARY_COLOR, "progress_color": PRIMARY_COLOR, "button_color": PRIMARY_COLOR, "button_hover_color": HOVER_COLOR}
@@ -104,16 +160,117 @@ class SoundBoardApp:
         self.stop_button = ctk.CTkButton(root, text="Stop Sound", fg_color=ACCENT_COLOR, text_color=TEXT_COLOR, hover_color="#FFB347", command=self.stop_sound)
         self.stop_button.pack(pady=20, padx=20, fill="x")
 
+        # Status line; errors show here instead of in dialogs that would stop the show
+        self.status_label = ctk.CTkLabel(root, text="", text_color=ACCENT_COLOR, anchor="w")
+        self.status_label.pack(pady=(0, 10), padx=20, fill="x")
+        self._status_clear = None
+
+        # Optional overlay with live timings and counters
+        self.metrics_overlay = None
+        self.metrics_exporter = None
+
         # Bind keys
+        self.engine.action_handlers["New"] = self.prompt_add_sound
         self.bind_keys()
 
-        # Configure row weights
-        for i in range(10):
-            self.tile_frame.grid_rowconfigure(i * 2, weight=1)
-            self.tile_frame.grid_rowconfigure(i * 2 + 1, weight=0)
-
-        # Update tile sizes on resize
-        self.root.bind("<Configure>", self.on_window_resize)
+        # Save pending changes before the window goes away
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def finish_startup(self, frequency=AUDIO_FREQUENCY, buffer=AUDIO_BUFFER, channels=AUDIO_CHANNELS):
+        """Opens the audio device and warms the library in the background; call once the window is drawn."""
+        if not self.engine.audio_ready.is_set():
+            self.engine.start_audio(frequency, buffer, channels)
+        self.measure_event_loop_lag()
+        # Decode, analyze and build waveforms once the grid can show them
+        return self.engine.preload()
+
+    def measure_event_loop_lag(self, due=None):
+        """Records how late this timer fires, i.e. how long the Tk event loop was busy, and re-arms it."""
+        now = time.perf_counter()
+        if due is not None:
+            METRICS.observe("event_loop_lag", max(0.0, now - due))
+        self.root.after(LAG_PROBE_MS, self.measure_event_loop_lag, now + LAG_PROBE_MS / 1000)
+
+    def start_metrics_export(self, path=None, address=None, format=JSON, interval=DEFAULT_EXPORT_INTERVAL):
+        """Writes engine stats and metrics to a file and/or socket every `interval` seconds."""
+        self.metrics_exporter = MetricsExporter(self.engine.stats, path, address, interval, format)
+        self.metrics_exporter.start()
+
+    def toggle_metrics_overlay(self):
+        if self.metrics_overlay is not None:
+            self.metrics_overlay.destroy()
+            self.metrics_overlay = None
+            return
+        self.metrics_overlay = ctk.CTkLabel(self.root, text="", font=ctk.CTkFont(family="Courier", size=11), justify="left", fg_color=TILE_BG, text_color=TEXT_COLOR, corner_radius=6)
+        self.metrics_overlay.place(relx=1.0, rely=0.0, x=-10, y=10, anchor="ne")
+        self.update_metrics_overlay()
+
+    def update_metrics_overlay(self):
+        if self.metrics_overlay is None:
+            return
+        self.metrics_overlay.configure(text=metrics_text(self.engine.stats()))
+        self.root.after(OVERLAY_REFRESH_MS, self.update_metrics_overlay)
+
+    def show_status(self, message):
+        """Shows a message in the status line for a few seconds."""
+        self.status_label.configure(text=message)
+        if self._status_clear is not None:
+            self.root.after_cancel(self._status_clear)
+        self._status_clear = self.root.after(STATUS_MS, self.clear_status)
+
+    def clear_status(self):
+        self._status_clear = None
+        self.status_label.configure(text="")
+
+    def print_startup_timings(self, preload):
+        """Prints how long each startup phase took, once the library is preloaded."""
+        if preload.is_alive():
+            self.root.after(IMPORT_POLL_MS, self.print_startup_timings, preload)
+            return
+        for phase, milliseconds in self.engine.timings.items():
+            print(f"{phase:>14}: {milliseconds:8.1f} ms")
+
+    def on_close(self):
+        try:
+            self.engine.store.save_layout({"geometry": self.root.geometry(), "board": self.engine.board, "bank": self.engine.hotkeys.active_bank})
+        except OSError as e:
+            print(f"Could not save the window layout: {e}")
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        self.engine.close()
+        self.root.destroy()
+
+    def show_engine_error(self, title, message):
+        """Shows an engine error in the status line on the Tk thread, whichever thread reported it."""
+        self.root.after(0, self.show_status, f"{title}: {message}")
+
+    def tile_waveform(self, name, width, height):
+        """Draws a tile's waveform from its stored peaks, or returns None until they are built."""
+        path = self.sound_buttons_data.get(name)
+        levels = self.engine.peaks.peaks_for(path) if path else None
+        if levels is None:
+            return None
+        color = tuple(int(PRIMARY_COLOR[i:i + 2], 16) for i in (1, 3, 5))
+        return PhotoImage(master=self.root, data=waveform_png(levels, width, height, color), format="png")
+
+    def show_waveforms(self, names):
+        """Redraws tiles whose peaks were just built, or every tile for None; called from the peak builder thread."""
+        self.root.after(0, self.refresh_tiles, names)
+
+    def refresh_tiles(self, names):
+        if names is None:
+            self.tile_grid.refresh()
+            return
+        for name in names:
+            self.tile_grid.refresh(name)
+
+    @property
+    def sound_buttons_data(self):
+        return self.engine.sounds
+
+    @property
+    def key_bindings(self):
+        return self.engine.key_bindings
 
     def update_new_tile_key_display(self):
         """Updates the key binding display below the 'New' tile."""
@@ -122,15 +279,19 @@ class SoundBoardApp:
         else:
             self.new_tile_key_label.configure(text="")
 
-    def update_new_tile_interaction(self):
-        """Binds right-click to the 'New' tile to show its context menu."""
-        self.add_new_tile_button.bind("<Button-3>", self.show_context_menu_new_tile)
-
     def show_context_menu_new_tile(self, event):
         """Displays the right-click context menu for the 'New' tile."""
         context_menu = Menu(self.root, tearoff=0)
         context_menu.add_command(label="Edit Key Binding", command=self.prompt_rebind_new_tile)
         context_menu.add_command(label="Delete Key Binding", command=self.delete_key_binding_new_tile)
+        context_menu.add_command(label="Import Folder", command=self.prompt_import_folder)
+        context_menu.add_separator()
+        context_menu.add_command(label="Bind Bank Switch Key", command=self.prompt_bind_bank_key)
+        context_menu.add_separator()
+        context_menu.add_command(label="New Board", command=self.prompt_new_board)
+        context_menu.add_command(label="Delete Board", command=self.confirm_delete_board)
+        context_menu.add_separator()
+        context_menu.add_command(label="Hide Metrics" if self.metrics_overlay is not None else "Show Metrics", command=self.toggle_metrics_overlay)
         context_menu.tk_popup(event.x_root, event.y_root)
 
     def prompt_rebind_new_tile(self):
@@ -138,61 +299,28 @@ class SoundBoardApp:
         current_binding = self.key_bindings.get("New", "None")
         new_binding = simpledialog.askstring("Rebind 'New' Tile", f"Enter new key binding for the 'New' tile (current: '{current_binding}'):")
         if new_binding is not None:
-            if new_binding:
-                if new_binding in [v for k, v in self.key_bindings.items() if k != "New"]:
-                    messagebox.showerror("Error", f"Key '{new_binding}' is already assigned to a sound tile.")
-                    return
-                self.key_bindings["New"] = new_binding
-            elif "New" in self.key_bindings:
-                del self.key_bindings["New"]
-                messagebox.showinfo("Info", "Key binding for 'New' tile removed.")
-            self.save_data("key_bindings.json", self.key_bindings)
-            try:
-                self.root.unbind(current_binding)
-            except Exception as e:
-                print(f"Error unbinding key '{current_binding}' for 'New' tile: {e}")
             if new_binding:
                 try:
-                    self.root.bind(new_binding, self.prompt_add_sound)
-                except Exception as e:
-                    messagebox.showerror("Key Binding Error", f"Could not bind key '{new_binding}' for 'New' tile: {e}")
+                    self.engine.set_binding("New", new_binding)
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
+                    return
+            elif self.engine.remove_binding("New") is not None:
+                self.show_status("Key binding for 'New' tile removed.")
             self.update_new_tile_key_display()
 
     def delete_key_binding_new_tile(self):
         """Deletes the key binding for the 'New' tile."""
         if "New" in self.key_bindings:
-            key_to_unbind = self.key_bindings.pop("New")
-            self.save_data("key_bindings.json", self.key_bindings)
-            try:
-                self.root.unbind(key_to_unbind)
-            except Exception as e:
-                print(f"Error unbinding key '{key_to_unbind}' for 'New' tile: {e}")
+            key_to_unbind = self.engine.remove_binding("New")
             self.update_new_tile_key_display()
-            messagebox.showinfo("Info", f"Key binding '{key_to_unbind}' for 'New' tile deleted.")
+            self.show_status(f"Key binding '{key_to_unbind}' for 'New' tile deleted.")
         else:
-            messagebox.showinfo("Info", "No key binding assigned to the 'New' tile.")
+            self.show_status("No key binding assigned to the 'New' tile.")
 
     def on_window_resize(self, event):
-        """Adjust tile sizes to maintain a square aspect ratio."""
-        tile_width = (self.tile_frame.winfo_width() - 20) // self.num_columns
-        tile_height = tile_width
-        self.add_new_tile_button.configure(width=tile_width, height=tile_height)
-        for tile in self.tile_widgets.values():
-            if isinstance(tile, tuple):
-                tile_widget, _ = tile
-                tile_widget.configure(width=tile_width, height=tile_height)
-            else:
-                tile.configure(width=tile_width, height=tile_height)
-
-    def load_data(self, filename):
-        if os.path.exists(filename):
-            with open(filename, "r") as f:
-                return json.load(f)
-        return {}
-
-    def save_data(self, filename, data):
-        with open(filename, "w") as f:
-            json.dump(data, f)
+        """Adjust tile sizes to maintain a square aspect ratio, at most once per frame."""
+        self.tile_grid.schedule_resize(event)
 
     def prompt_add_sound(self):
         """Opens file explorer and adds a new sound tile."""
@@ -202,74 +330,244 @@ class SoundBoardApp:
             file_name = os.path.splitext(file_name_with_ext)[0]
             self.add_new_sound_tile(file_name, file_path)
 
+    def prompt_import_folder(self):
+        """Imports every audio file in a folder in the background."""
+        folder = filedialog.askdirectory(title="Select Sound Folder")
+        if not folder:
+            return
+        recursive = messagebox.askyesno("Import Folder", "Include subfolders?")
+        # Files that will be streamed are only validated; their decoded audio isn't kept
+        job = ImportJob(folder, recursive, skip_paths=self.sound_buttons_data.values(), keep_sound=lambda path: self.engine.streamer.mode_for(path) != STREAM)
+        job.start()
+
+        progress_window = ctk.CTkToplevel(self.root)
+        progress_window.title("Importing Sounds")
+        progress_window.configure(fg_color=SECONDARY_COLOR)
+        progress_window.transient(self.root)
+        progress_label = ctk.CTkLabel(progress_window, text="Scanning folder...", text_color=TEXT_COLOR)
+        progress_label.pack(pady=(20, 5), padx=20)
+        progress_bar = ctk.CTkProgressBar(progress_window, progress_color=PRIMARY_COLOR)
+        progress_bar.set(0)
+        progress_bar.pack(pady=5, padx=20, fill="x")
+        cancel_button = ctk.CTkButton(progress_window, text="Cancel", fg_color=ACCENT_COLOR, text_color=TEXT_COLOR, hover_color="#FFB347", command=job.cancel)
+        cancel_button.pack(pady=(5, 20), padx=20)
+        progress_window.protocol("WM_DELETE_WINDOW", job.cancel)
+        self.poll_import(job, progress_window, progress_label, progress_bar, 0)
+
+    def poll_import(self, job, progress_window, progress_label, progress_bar, imported):
+        """Adds the tiles a folder import has validated so far, one batch per call."""
+        finished = job.finished.is_set()
+        results = job.drain()
+        if results:
+            names = self.engine.add_sounds(results)
+            self.tile_grid.extend(names)
+            imported += len(names)
+        if job.total:
+            progress_bar.set(job.done / job.total)
+            progress_label.configure(text=f"Checked {job.done} of {job.total} files, added {imported}")
+        if not finished:
+            self.root.after(IMPORT_POLL_MS, self.poll_import, job, progress_window, progress_label, progress_bar, imported)
+            return
+
+        # One save and one layout pass for the whole import
+        progress_window.destroy()
+        self.engine.store.mark_dirty()
+        self.tile_grid.layout()
+        summary = f"Added {imported} sound(s)."
+        if job.cancelled:
+            summary = f"Import cancelled. {summary}"
+        if job.failed:
+            skipped = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in job.failed[:10])
+            summary += f"\n\nSkipped {len(job.failed)} file(s):\n{skipped}"
+        messagebox.showinfo("Import Folder", summary)
+
     def add_new_sound_tile(self, name, path):
         """Adds a new sound tile to the grid and saves its data."""
-        new_tile = self.create_sound_tile(name, path, self.tile_style)
-        self.tile_widgets[name] = new_tile
-        self.sound_buttons_data[name] = path
-
-        self.save_data("sounds.json", self.sound_buttons_data)
-        self.regrid_tiles()
-
-    def create_sound_tile(self, name, path, style):
-        tile = ctk.CTkButton(self.tile_frame, text=name, compound="top", font=ctk.CTkFont(size=12, weight="bold"), command=lambda: self.play_sound(path) if path else None, **style)
-        tile.bind("<Button-3>", lambda event: self.show_context_menu(event, name, tile))
-        tile.bind("<Enter>", lambda event: self.on_enter(tile))
-        tile.bind("<Leave>", lambda event: self.on_leave(tile))
-        row = self.tile_row * 2
-        tile.grid(row=row, column=self.tile_col, padx=5, pady=5, sticky="nsew")
-        key_label = ctk.CTkLabel(self.tile_frame, text="", text_color=TEXT_COLOR, font=ctk.CTkFont(size=10))
-        key_label.grid(row=row + 1, column=self.tile_col, padx=5, pady=(0, 5), sticky="ew")
-        self.tile_widgets[name] = (tile, key_label)
-        self.update_key_label(name)
-        if name in self.key_bindings and path:
+        if name in self.sound_buttons_data:
+            self.tile_grid.remove(name)
+        self.engine.add_sound(name, path)
+        self.tile_grid.insert(name)
+
+    def trigger_tile(self, name):
+        path = self.sound_buttons_data.get(name)
+        if path:
+            self.play_sound(path, name)
+
+    def key_label_text(self, name):
+        """Returns the key binding text shown below a tile."""
+        if name in self.key_bindings and self.key_bindings[name]:
+            bank = self.engine.bank_of(name)
+            return f"[{bank}: {self.key_bindings[name]}]" if bank else f"[{self.key_bindings[name]}]"
+        return ""
+
+    def on_board_selected(self, choice):
+        try:
+            self.engine.switch_board(choice)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not open board '{choice}': {e}")
+            self.board_menu.set(self.engine.board)
+
+    def on_board_switched(self, board):
+        """Shows a board switch on the Tk thread; the trigger server switches boards from its own thread."""
+        self.root.after(0, self.show_board, board)
+
+    def show_board(self, board):
+        """Shows the tiles of the board that was just opened."""
+        self.board_menu.configure(values=self.engine.boards())
+        self.board_menu.set(board)
+        self.tile_grid.set_names(self.sound_buttons_data)
+        self.update_new_tile_key_display()
+
+    def prompt_new_board(self):
+        """Prompts for a name and opens a new, empty board."""
+        board = simpledialog.askstring("New Board", "Enter a name for the new board:")
+        if not board:
+            return
+        try:
+            self.engine.create_board(board)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+
+    def confirm_delete_board(self):
+        """Confirms before deleting the open board and returns to the default one."""
+        board = self.engine.board
+        if board == DEFAULT_BOARD:
+            messagebox.showinfo("Info", "The default board can't be deleted.")
+            return
+        if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the board '{board}' and all its tiles?"):
+            try:
+                self.engine.delete_board(board)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not delete board '{board}': {e}")
+            self.board_menu.configure(values=self.engine.boards())
+
+    def bank_choices(self):
+        return ["Global"] + self.engine.banks()
+
+    def on_bank_selected(self, choice):
+        self.engine.switch_bank(GLOBAL_BANK if choice == "Global" else choice)
+
+    def on_bank_switched(self, bank):
+        """Shows a bank switch on the Tk thread; hotkeys and the trigger server switch banks from their own threads."""
+        self.root.after(0, self.show_active_bank, bank)
+
+    def show_active_bank(self, bank):
+        """Keeps the bank selector in step with hotkey bank switches."""
+        self.bank_menu.configure(values=self.bank_choices())
+        self.bank_menu.set(bank or "Global")
+
+    def prompt_bind_bank_key(self):
+        """Prompts for a bank name and the key that switches to it."""
+        bank = simpledialog.askstring("Bank Switch Key", "Enter the bank to switch to:")
+        if not bank:
+            return
+        action = BANK_PREFIX + bank
+        current_binding = self.key_bindings.get(action, "None")
+        key = simpledialog.askstring("Bank Switch Key", f"Enter key binding that switches to bank '{bank}' (current: '{current_binding}'):")
+        if key:
             try:
-                self.root.bind(self.key_bindings[name], lambda event, path=file_path: self.play_sound(path))
-            except Exception as e:
-                messagebox.showerror("Key Binding Error", f"Could not bind key '{self.key_bindings[name]}': {e}")
-        return (tile, key_label)
+                self.engine.set_binding(action, key)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.bank_menu.configure(values=self.bank_choices())
+
+    def prompt_set_bank(self, tile_name):
+        """Moves a tile's key binding into a bank."""
+        current_bank = self.engine.bank_of(tile_name)
+        bank = simpledialog.askstring("Set Bank", f"Enter bank for '{tile_name}' (empty for global):", initialvalue=current_bank)
+        if bank is None:
+            return
+        try:
+            self.engine.set_tile_bank(tile_name, bank.strip())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.bank_menu.configure(values=self.bank_choices())
+        self.update_key_label(tile_name)
+
+    def prompt_set_trim(self, tile_name):
+        """Prompts for a tile's volume trim in dB, on top of loudness normalization."""
+        current_trim = self.engine.tile_settings.get(tile_name, {}).get("trim_db", 0.0)
+        # Volume is capped at full scale, so a boost only works as far as normalization turned the clip down
+        headroom = min(MAX_TRIM_DB, math.floor(self.engine.trim_headroom_db(tile_name) * 10) / 10)
+        if headroom > 0:
+            limit = f"at most +{headroom:g} dB, the clip's headroom"
+        else:
+            limit = "it already plays at full volume, so it can only be turned down"
+        trim_db = simpledialog.askfloat("Set Volume Trim", f"Enter volume trim in dB for '{tile_name}' (0 for none; {limit}):", initialvalue=min(current_trim, headroom), minvalue=MIN_TRIM_DB, maxvalue=headroom)
+        if trim_db is not None:
+            self.engine.set_tile_trim(tile_name, trim_db)
+
+    def prompt_set_priority(self, tile_name):
+        """Prompts for a tile's priority; with --steal-policy lowest_priority, low-priority voices are cut first."""
+        current_priority = self.engine.tile_settings.get(tile_name, {}).get("priority", 0)
+        priority = simpledialog.askinteger("Set Priority", f"Enter voice priority for '{tile_name}' (higher is kept longer):", initialvalue=current_priority)
+        if priority is not None:
+            self.engine.set_tile_priority(tile_name, priority)
+
+    def set_tile_source(self, tile_name, mode):
+        try:
+            self.engine.set_tile_playback(tile_name, mode)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+
+    def prompt_set_effect(self, tile_name, effect, label, prompt):
+        """Prompts for one of a tile's effect parameters, keeping the others."""
+        effects = dict(self.engine.tile_settings.get(tile_name, {}).get("effects", {}))
+        value = simpledialog.askfloat(label, f"Enter {prompt} for '{tile_name}':", initialvalue=effects.get(effect, EFFECTS[effect]))
+        if value is None:
+            return
+        effects[effect] = value
+        try:
+            self.engine.set_tile_effects(tile_name, effects)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
 
     def update_key_label(self, name):
         """Updates the key binding label below a tile."""
-        if name in self.tile_widgets and isinstance(self.tile_widgets[name], tuple) and len(self.tile_widgets[name]) == 2:
-            tile, label = self.tile_widgets[name]
-            if name in self.key_bindings and self.key_bindings[name]:
-                label.configure(text=f"[{self.key_bindings[name]}]")
-            else:
-                label.configure(text="")
-        elif name == "New":
+        if name == "New":
             self.update_new_tile_key_display()
+        else:
+            self.tile_grid.refresh(name)
 
-    def show_context_menu(self, event, tile_name, tile_widget):
+    def show_context_menu(self, event, tile_name):
         """Displays the right-click context menu for sound tiles."""
         context_menu = Menu(self.root, tearoff=0)
-        context_menu.add_command(label="Edit Name", command=lambda: self.prompt_edit_name(tile_widget, tile_name))
+        context_menu.add_command(label="Edit Name", command=lambda: self.prompt_edit_name(tile_name))
         context_menu.add_command(label="Edit Key Binding", command=lambda: self.edit_key_binding(tile_name))
-        context_menu.add_command(label="Delete Key Binding", command=lambda: self.delete_key_binding(tile_name, tile_widget))
+        context_menu.add_command(label="Delete Key Binding", command=lambda: self.delete_key_binding(tile_name))
+        context_menu.add_command(label="Set Bank", command=lambda: self.prompt_set_bank(tile_name))
+        context_menu.add_command(label="Set Volume Trim", command=lambda: self.prompt_set_trim(tile_name))
+        context_menu.add_command(label="Set Priority", command=lambda: self.prompt_set_priority(tile_name))
+        mode_menu = Menu(context_menu, tearoff=0)
+        for policy in POLICIES:
+            mode_menu.add_command(label=policy.capitalize(), command=lambda policy=policy: self.set_tile_policy(tile_name, policy))
+        context_menu.add_cascade(label="Playback Mode", menu=mode_menu)
+        source_menu = Menu(context_menu, tearoff=0)
+        for mode, label in PLAYBACK_SOURCES:
+            source_menu.add_command(label=label, command=lambda mode=mode: self.set_tile_source(tile_name, mode))
+        context_menu.add_cascade(label="Playback Source", menu=source_menu)
+        effects_menu = Menu(context_menu, tearoff=0)
+        for effect, label, prompt in EFFECT_PROMPTS:
+            effects_menu.add_command(label=label, command=lambda effect=effect, label=label, prompt=prompt: self.prompt_set_effect(tile_name, effect, label, prompt))
+        effects_menu.add_separator()
+        effects_menu.add_command(label="Clear Effects", command=lambda: self.engine.set_tile_effects(tile_name, {}))
+        context_menu.add_cascade(label="Effects", menu=effects_menu)
         context_menu.add_separator()
-        context_menu.add_command(label="Delete Tile", command=lambda: self.confirm_delete_tile(tile_name, tile_widget))
+        context_menu.add_command(label="Delete Tile", command=lambda: self.confirm_delete_tile(tile_name))
 
         context_menu.tk_popup(event.x_root, event.y_root)
 
-    def prompt_edit_name(self, tile_widget, old_name):
+    def prompt_edit_name(self, old_name):
         """Prompts for a new name and updates the tile."""
         new_name = simpledialog.askstring("Edit Tile Name", "Enter new name:", initialvalue=old_name)
         if new_name and new_name != old_name:
-            if old_name in self.tile_widgets:
-                widget_info = self.tile_widgets.pop(old_name)
-                if isinstance(widget_info, tuple) and len(widget_info) == 2:
-                    tile, label = widget_info
-                    tile.configure(text=new_name)
-                    self.tile_widgets[new_name] = (tile, label)
-                else:
-                    self.tile_widgets[new_name] = widget_info
-            self.sound_buttons_data[new_name] = self.sound_buttons_data.pop(old_name)
-            if old_name in self.key_bindings:
-                self.key_bindings[new_name] = self.key_bindings.pop(old_name)
-            self.save_data("sounds.json", self.sound_buttons_data)
-            self.save_data("key_bindings.json", self.key_bindings)
-            self.bind_keys()
-            self.regrid_tiles()
+            if new_name in self.sound_buttons_data:
+                messagebox.showerror("Error", f"A tile named '{new_name}' already exists.")
+                return
+            self.engine.rename_sound(old_name, new_name)
+            self.tile_grid.rename(old_name, new_name)
 
     def edit_key_binding(self, tile_name):
         """Allows the user to change the key binding for a sound tile."""
@@ -277,167 +575,115 @@ class SoundBoardApp:
         new_binding = simpledialog.askstring("Edit Key Binding", f"Enter new key binding for '{tile_name}' (current: '{current_binding}'):")
         if new_binding is not None:
             if new_binding:
-                if new_binding in [v for k, v in self.key_bindings.items() if k != "New" and k != tile_name]:
-                    messagebox.showerror("Error", f"Key '{new_binding}' is already assigned to another action.")
-                    return
-                self.key_bindings[tile_name] = new_binding
-            elif tile_name in self.key_bindings:
-                del self.key_bindings[tile_name]
-                messagebox.showinfo("Info", f"Key binding for '{tile_name}' removed.")
-            self.save_data("key_bindings.json", self.key_bindings)
-            self.unbind_key(tile_name)
-            file_path = self.sound_buttons_data.get(tile_name)
-            if new_binding and file_path:
                 try:
-                    self.root.bind(new_binding, lambda event, path=file_path: self.play_sound(path))
-                except Exception as e:
-                    messagebox.showerror("Key Binding Error", f"Could not bind key '{new_binding}' for '{tile_name}': {e}")
+                    self.engine.set_binding(tile_name, new_binding)
+                except ValueError as e:
+                    messagebox.showerror("Error", str(e))
+                    return
+            elif self.engine.remove_binding(tile_name) is not None:
+                self.show_status(f"Key binding for '{tile_name}' removed.")
             self.update_key_label(tile_name)
 
-    def delete_key_binding(self, tile_name, tile_widget):
+    def delete_key_binding(self, tile_name):
         """Deletes the key binding for a tile."""
         if tile_name in self.key_bindings:
-            key_to_unbind = self.key_bindings.pop(tile_name)
-            self.save_data("key_bindings.json", self.key_bindings)
-            self.unbind_key(tile_name)
+            key_to_unbind = self.engine.remove_binding(tile_name)
             self.update_key_label(tile_name)
-            messagebox.showinfo("Info", f"Key binding '{key_to_unbind}' for '{tile_name}' deleted.")
+            self.show_status(f"Key binding '{key_to_unbind}' for '{tile_name}' deleted.")
         else:
-            messagebox.showinfo("Info", f"No key binding assigned to '{tile_name}'.")
+            self.show_status(f"No key binding assigned to '{tile_name}'.")
 
-    def confirm_delete_tile(self, name, tile):
+    def confirm_delete_tile(self, name):
         """Confirms before deleting a tile."""
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete '{name}'?"):
-            self.delete_tile(name, tile)
+            self.delete_tile(name)
 
-    def on_enter(self, tile):
-        tile.configure(fg_color=HOVER_COLOR)
-        if tile == self.add_new_tile_button:
-            tile.configure(fg_color=ADD_TILE_HOVER)
-
-    def on_leave(self, tile):
-        tile.configure(fg_color=TILE_BG)
-        if tile == self.add_new_tile_button:
-            tile.configure(fg_color=ADD_TILE_BG)
-
-    def play_sound(self, file_path):
-        try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-        except pygame.error as e:
-            messagebox.showerror("Playback Error", f"Could not play sound '{os.path.basename(file_path)}': {e}")
-        except Exception as e:
-            messagebox.showerror("Unexpected Error", f"An unexpected error occurred during playback: {e}")
+    def play_sound(self, file_path, name=None):
+        self.engine.play_file(file_path, name)
 
     def stop_sound(self):
-        pygame.mixer.music.stop()
-
-    def delete_tile(self, name, tile):
+        self.engine.stop_all()
+
+    def set_tile_policy(self, tile_name, policy):
+        """Sets how a tile behaves when triggered while other sounds are playing."""
+        choke_group = None
+        if policy == CHOKE:
+            current_group = self.engine.tile_settings.get(tile_name, {}).get("choke_group") or ""
+            choke_group = simpledialog.askstring("Choke Group", f"Enter choke group for '{tile_name}':", initialvalue=current_group)
+            if not choke_group:
+                return
+        self.engine.set_tile_policy(tile_name, policy, choke_group)
+
+    def delete_tile(self, name):
         """Deletes a sound tile and its associated data."""
-        if name in self.tile_widgets:
-            widget_info = self.tile_widgets.pop(name)
-            if isinstance(widget_info, tuple) and len(widget_info) == 2:
-                tile_widget, key_label = widget_info
-                tile_widget.destroy()
-                key_label.destroy()
-            else:
-                widget_info.destroy()
-        if name in self.sound_buttons_data:
-            del self.sound_buttons_data[name]
-        if name in self.key_bindings:
-            del self.key_bindings[name]
-        self.save_data("sounds.json", self.sound_buttons_data)
-        self.save_data("key_bindings.json", self.key_bindings)
-        self.unbind_key(name)
-        self.regrid_tiles()
+        self.engine.remove_sound(name)
+        self.tile_grid.remove(name)
 
     def set_volume(self, volume):
-        pygame.mixer.music.set_volume(float(volume))
+        self.engine.set_volume(volume)
 
     def bind_keys(self):
-        for name, key in self.key_bindings.items():
-            if name in self.sound_buttons_data:
-                file_path = self.sound_buttons_data[name]
-                try:
-                    self.root.bind(key, lambda event, path=file_path: self.play_sound(path))
-                except Exception as e:
-                    messagebox.showerror("Key Binding Error", f"Could not bind key '{key}' for '{name}': {e}")
-            if name == "New":
-                try:
-                    self.root.bind(key, self.prompt_add_sound)
-                except Exception as e:
-                    messagebox.showerror("Key Binding Error", f"Could not bind key '{key}' for 'New' tile: {e}")
+        """Routes every key press through the engine's hotkey dispatcher."""
+        self.root.bind("<KeyPress>", lambda event: self.engine.hotkeys.key_press(event.keysym))
+        self.root.bind("<KeyRelease>", lambda event: self.engine.hotkeys.key_release(event.keysym))
+        self.root.bind("<FocusOut>", lambda event: self.engine.hotkeys.reset())
         self.update_new_tile_key_display()
-        for name in self.tile_widgets:
-            self.update_key_label(name)
-
-    def unbind_key(self, name):
-        if name in self.key_bindings:
-            key = self.key_bindings[name]
-            try:
-                self.root.unbind(key)
-            except Exception as e:
-                print(f"Error unbinding key '{key}' for '{name}': {e}")
+        self.tile_grid.refresh()
 
     def regrid_tiles(self):
-        for widget in self.tile_frame.winfo_children():
-            widget.grid_forget()
-
-        self.tile_row = 0
-        self.tile_col = 0
-        tile_width = (self.tile_frame.winfo_width() - 20) // self.num_columns
-        tile_height = tile_width
-        self.add_new_tile_button.configure(width=tile_width, height=tile_height, text="New", compound="top")
-        self.add_new_tile_button.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
-        self.new_tile_key_label.grid(row=1, column=0, padx=5, pady=(0, 5), sticky="ew")
-        self.update_new_tile_key_display()
-        self.update_new_tile_interaction()
-
-        self.tile_row = 0
-        self.tile_col = 1
-        for name, widgets in self.tile_widgets.items():
-            if isinstance(widgets, tuple) and len(widgets) == 2:
-                tile, key_label = widgets
-                tile.configure(width=tile_width, height=tile_height, text=name, compound="top")
-                row = self.tile_row * 2
-                tile.grid(row=row, column=self.tile_col, padx=5, pady=5, sticky="nsew")
-                key_label.grid(row=row + 1, column=self.tile_col, padx=5, pady=(0, 5), sticky="ew")
-                self.update_key_label(name)
-                self.tile_col += 1
-                if self.tile_col >= self.num_columns:
-                    self.tile_col = 0
-                    self.tile_row += 1
-                    self.add_new_tile_button.grid(row=self.tile_row * 2, column=0, padx=5, pady=5, sticky="nsew")
-                    self.new_tile_key_label.grid(row=self.tile_row * 2 + 1, column=0, padx=5, pady=(0, 5), sticky="ew")
-                    self.tile_col = 1
-            elif isinstance(widgets, ctk.CTkButton):
-                widgets.configure(width=tile_width, height=tile_height, text=name, compound="top")
-                row = self.tile_row * 2
-                widgets.grid(row=row, column=self.tile_col, padx=5, pady=5, sticky="nsew")
-                self.tile_col += 1
-                if self.tile_col >= self.num_columns:
-                    self.tile_col = 0
-                    self.tile_row += 1
-                    self.add_new_tile_button.grid(row=self.tile_row * 2, column=0, padx=5, pady=5, sticky="nsew")
-                    self.new_tile_key_label.grid(row=self.tile_row * 2 + 1, column=0, padx=5, pady=(0, 5), sticky="ew")
-                    self.tile_col = 1
-
-        # Ensure add button is placed even if no other tiles exist
-        if not self.tile_widgets:
-            self.add_new_tile_button.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
-            self.new_tile_key_label.grid(row=1, column=0, padx=5, pady=(0, 5), sticky="ew")
-
-        # Ensure row weights are configured for vertical expansion
-        for i in range(self.tile_row + 1):
-            self.tile_frame.grid_rowconfigure(i * 2, weight=1)
-            self.tile_frame.grid_rowconfigure(i * 2 + 1, weight=0)
-
+        """Re-applies size, names and key labels to every visible tile."""
+        self.tile_grid.layout()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual Soundboard")
+    parser.add_argument("--trigger-port", type=int, help="also accept trigger commands on this localhost TCP port")
+    parser.add_argument("--record", metavar="JOURNAL", help="record triggers, stops and volume changes to this file for replay.py")
+    parser.add_argument("--frequency", type=int, default=AUDIO_FREQUENCY, help="audio device sample rate in Hz")
+    parser.add_argument("--buffer", type=int, default=AUDIO_BUFFER, help="audio device buffer size in samples; smaller is lower latency")
+    parser.add_argument("--channels", type=int, default=AUDIO_CHANNELS, help="audio device output channels")
+    parser.add_argument("--max-voices", type=int, default=DEFAULT_MAX_VOICES, help="sounds that can play at once")
+    parser.add_argument("--steal-policy", choices=STEAL_POLICIES, default=STEAL_OLDEST, help="which sound to cut when every voice is busy")
+    parser.add_argument("--startup-timings", action="store_true", help="print how long each startup phase took")
+    parser.add_argument("--metrics", action="store_true", help="show the metrics overlay")
+    parser.add_argument("--metrics-file", help="write metrics snapshots to this file")
+    parser.add_argument("--metrics-socket", metavar="HOST:PORT", help="send metrics snapshots to a TCP listener")
+    parser.add_argument("--metrics-format", choices=FORMATS, default=JSON, help="format of exported metrics snapshots")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_EXPORT_INTERVAL, help="seconds between exported snapshots")
+    args = parser.parse_args()
+
+    timings = {"imports": (time.perf_counter() - LAUNCHED) * 1000}
+    phase_started = time.perf_counter()
+
+    def end_phase(phase):
+        global phase_started
+        now = time.perf_counter()
+        timings[phase] = (now - phase_started) * 1000
+        phase_started = now
+
     ctk.set_appearance_mode("Dark")
     ctk.set_default_color_theme("blue")
 
     root = ctk.CTk()
-    app = SoundBoardApp(root)
+    end_phase("window")
+    engine = SoundBoardEngine(defer_audio=True, max_voices=args.max_voices, steal_policy=args.steal_policy)
+    end_phase("board")
+    app = SoundBoardApp(root, engine)
+    end_phase("widgets")
+    root.update()
+    end_phase("first_frame")
+    engine.timings.update(timings)
+    preload = app.finish_startup(args.frequency, args.buffer, args.channels)
+    if args.startup_timings:
+        app.print_startup_timings(preload)
+    if args.metrics:
+        app.toggle_metrics_overlay()
+    if args.metrics_file or args.metrics_socket:
+        address = parse_address(args.metrics_socket) if args.metrics_socket else None
+        app.start_metrics_export(args.metrics_file, address, args.metrics_format, args.metrics_interval)
+    if args.record:
+        app.engine.journal.start(args.record)
+    if args.trigger_port:
+        from trigger_server import TriggerServer
+        TriggerServer(app.engine, port=args.trigger_port).start_in_thread()
     root.mainloop()
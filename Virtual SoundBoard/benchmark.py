@@ -0,0 +1,282 @@
+"""Trigger-to-audio latency and throughput benchmarks.
+
+Runs headless with SDL's dummy audio driver. The UI benchmarks (regrid,
+resize, startup) need a display and are reported as skipped without one.
+
+    python benchmark.py --output bench_results.json
+    python benchmark.py --output new.json --compare bench_results.json
+"""
+import os
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+
+import pygame
+
+from metrics import summarize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHORT_CLIP = os.path.join(HERE, "ara-ara.mp3")
+LONG_CLIP = os.path.join(HERE, "doors-elevator-music.mp3")
+TILE_COUNTS = (10, 100, 1000)
+LIBRARY_SIZES = (1000, 10000, 100000)
+# The resize benchmark alternates between these window sizes
+RESIZE_WIDTHS = (900, 1200)
+RESIZE_HEIGHT = 700
+
+# A benchmark is flagged as a regression when it gets this much slower,
+# ignoring differences too small to be more than timer noise
+REGRESSION_THRESHOLD = 1.2
+MIN_REGRESSION_MS = 0.1
+# Kept at p90 rather than the live p95 so results compare with earlier runs
+BENCHMARK_QUANTILES = (0.50, 0.90, 0.99)
+
+
+def percentiles(samples):
+    """Summarizes timings in seconds as milliseconds."""
+    return summarize(samples, BENCHMARK_QUANTILES)
+
+
+def make_library(data_dir, count, clip=SHORT_CLIP):
+    """Writes a board with `count` tiles that all point at one clip."""
+    from store import BoardStore
+
+    sounds = {f"tile-{i:05d}": clip for i in range(count)}
+    bindings = {name: f"<F{i % 12 + 1}>" for i, name in enumerate(list(sounds)[:12])}
+    BoardStore(data_dir).write({"sounds": sounds, "key_bindings": bindings, "tile_settings": {}})
+    return sounds
+
+
+def bench_play_latency(data_dir, repeats):
+    """play_sound latency for cold (cache cleared) and warm triggers."""
+    from engine import SoundBoardEngine
+
+    results = {}
+    for label, clip in (("short", SHORT_CLIP), ("long", LONG_CLIP)):
+        engine = SoundBoardEngine(data_dir)
+        cold, warm = [], []
+        for _ in range(repeats):
+            engine.sample_cache.clear()
+            engine.streamer.invalidate(clip)
+            start = time.perf_counter()
+            engine.play_file(clip)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            engine.play_file(clip)
+            warm.append(time.perf_counter() - start)
+        engine.stop_all()
+        results[label] = {"cold": percentiles(cold), "warm": percentiles(warm)}
+    return results
+
+
+def bench_playback_memory(data_dir):
+    """Memory held by the bundled clips with every tile resident, streamed, or chosen by length."""
+    from engine import SoundBoardEngine
+    from store import BoardStore
+    from streaming import PLAYBACK_MODES, STREAM
+
+    clips = sorted(name for name in os.listdir(HERE) if name.lower().endswith((".mp3", ".wav", ".ogg")))
+    sounds = {os.path.splitext(name)[0]: os.path.join(HERE, name) for name in clips}
+    results = {}
+    for mode in PLAYBACK_MODES:
+        settings = {name: {"playback": mode} for name in sounds}
+        BoardStore(data_dir).write({"sounds": sounds, "key_bindings": {}, "tile_settings": settings})
+        engine = SoundBoardEngine(data_dir)
+        engine.preload().join()
+        results[mode] = {
+            "tiles": len(sounds),
+            "streamed_tiles": sum(engine.playback_mode(name, path) == STREAM for name, path in sounds.items()),
+            "resident_bytes": engine.sample_cache.used_bytes,
+            "stream_buffer_bytes": engine.streamer.used_bytes,
+        }
+        engine.close()
+    return results
+
+
+def bench_trigger_throughput(data_dir, duration):
+    """Maximum sustained warm triggers per second through the engine."""
+    from engine import SoundBoardEngine
+
+    make_library(data_dir, 16)
+    engine = SoundBoardEngine(data_dir)
+    names = list(engine.sounds)
+    engine.trigger(names[0])
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        engine.trigger(names[count % len(names)])
+        count += 1
+    elapsed = time.perf_counter() - start
+    engine.stop_all()
+    return {"triggers": count, "seconds": elapsed, "triggers_per_second": count / elapsed}
+
+
+def bench_hotkey_dispatch(repeats):
+    """Key-press to action lookup time as the number of bindings grows."""
+    from hotkeys import HotkeyDispatcher
+
+    results = {}
+    for size in LIBRARY_SIZES:
+        keys = [f"k{i}" for i in range(size)]
+        dispatcher = HotkeyDispatcher(on_action=lambda action: None)
+        dispatcher.compile({f"tile-{i:05d}": f"<Control-{key}>" for i, key in enumerate(keys)})
+        samples = []
+        dispatcher.key_press("Control_L")
+        for i in range(repeats * 20):
+            key = keys[i * 7919 % size]
+            start = time.perf_counter()
+            dispatcher.key_press(key)
+            samples.append(time.perf_counter() - start)
+            dispatcher.key_release(key)
+        results[str(size)] = percentiles(samples)
+    return results
+
+
+def bench_persistence(data_dir):
+    """Store load and save times at large library sizes."""
+    from engine import SoundBoardEngine
+
+    results = {}
+    for size in LIBRARY_SIZES:
+        make_library(data_dir, size)
+        start = time.perf_counter()
+        engine = SoundBoardEngine(data_dir)
+        load_time = time.perf_counter() - start
+        # What an edit costs the UI thread, and what the background flush costs
+        start = time.perf_counter()
+        engine.rename_sound("tile-00000", "renamed")
+        edit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        engine.store.flush()
+        save_time = time.perf_counter() - start
+        engine.close()
+        results[str(size)] = {"load_ms": load_time * 1000, "edit_ms": edit_time * 1000, "save_ms": save_time * 1000}
+    return results
+
+
+def bench_ui(data_dir, repeats):
+    """Startup, regrid_tiles and on_window_resize costs; needs a display."""
+    import tkinter
+    import customtkinter as ctk
+
+    try:
+        probe = tkinter.Tk()
+        probe.destroy()
+    except tkinter.TclError as e:
+        return {"skipped": f"no display: {e}"}
+
+    from engine import SoundBoardEngine
+    from Soundboard import SoundBoardApp
+
+    results = {}
+    for count in TILE_COUNTS:
+        make_library(data_dir, count)
+        start = time.perf_counter()
+        root = ctk.CTk()
+        app = SoundBoardApp(root, SoundBoardEngine(data_dir))
+        root.update()
+        startup = time.perf_counter() - start
+
+        grid = app.tile_grid
+        regrid, resize = [], []
+        for i in range(repeats):
+            start = time.perf_counter()
+            app.regrid_tiles()
+            root.update_idletasks()
+            regrid.append(time.perf_counter() - start)
+            # on_window_resize only schedules the work for the next frame, so time
+            # that work directly, after a real change of width
+            root.geometry(f"{RESIZE_WIDTHS[i % 2]}x{RESIZE_HEIGHT}")
+            root.update()
+            if grid._resize_pending is not None:
+                root.after_cancel(grid._resize_pending)
+            start = time.perf_counter()
+            grid._apply_resize()
+            root.update_idletasks()
+            resize.append(time.perf_counter() - start)
+        root.destroy()
+        results[str(count)] = {
+            "startup_ms": startup * 1000,
+            "regrid_tiles": percentiles(regrid),
+            "on_window_resize": percentiles(resize),
+        }
+    return results
+
+
+def run(repeats, duration, include_ui=True):
+    pygame.mixer.init()
+    data_dir = tempfile.mkdtemp(prefix="soundboard-bench-")
+    try:
+        results = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "pygame": pygame.version.ver,
+                "platform": platform.platform(),
+                "audio_driver": os.environ.get("SDL_AUDIODRIVER"),
+            },
+            "play_latency": bench_play_latency(data_dir, repeats),
+            "trigger_throughput": bench_trigger_throughput(data_dir, duration),
+            "playback_memory": bench_playback_memory(data_dir),
+            "hotkey_dispatch": bench_hotkey_dispatch(repeats),
+            "persistence": bench_persistence(data_dir),
+        }
+        if include_ui:
+            results["ui"] = bench_ui(data_dir, repeats)
+        return results
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def flatten(results, prefix=""):
+    """Yields (path, value) for every timing in a results tree."""
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif key.endswith("_ms"):
+            yield path, value
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns the timings that got slower than the baseline by more than the threshold."""
+    old = dict(flatten(baseline))
+    regressions = []
+    for path, value in flatten(current):
+        if path not in old or value - old[path] < MIN_REGRESSION_MS:
+            continue
+        if old[path] > 0 and value / old[path] > threshold:
+            regressions.append((path, old[path], value))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the soundboard's hot paths.")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds for the throughput test")
+    parser.add_argument("--no-ui", action="store_true", help="skip the benchmarks that need a display")
+    args = parser.parse_args()
+
+    results = run(args.repeats, args.duration, include_ui=not args.no_ui)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline)
+        for path, before, after in regressions:
+            print(f"REGRESSION {path}: {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            raise SystemExit(1)
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+
+from errors import ReportsErrors
+from lazy import LazyModule
+from loudness import sound_samples
+from metrics import METRICS
+from sample_cache import BudgetedCache, SampleCache
+
+pygame = LazyModule("pygame")
+np = LazyModule("numpy")
+
+
+# Per-tile effects, stored in tile_settings[name]["effects"], with their neutral values
+START = "start"          # seconds cut from the beginning
+END = "end"              # seconds cut from the end
+FADE_IN = "fade_in"      # seconds
+FADE_OUT = "fade_out"    # seconds
+SPEED = "speed"          # playback rate; like a tape, it shifts the pitch too
+PITCH = "pitch"          # semitones, applied the same way as speed
+EFFECTS = {START: 0.0, END: 0.0, FADE_IN: 0.0, FADE_OUT: 0.0, SPEED: 1.0, PITCH: 0.0}
+MIN_RATE = 0.25
+MAX_RATE = 4.0
+
+# The effects pygame.mixer.music can apply itself, so streamed tiles keep them
+STREAM_EFFECTS = (START, FADE_IN)
+
+# Memory budget for rendered variants (32 MB of PCM)
+DEFAULT_VARIANT_BUDGET_BYTES = 32 * 1024 * 1024
+
+
+def clean_effects(effects):
+    """Validates effect parameters and returns them without the neutral ones; raises ValueError."""
+    cleaned = {}
+    for effect, value in effects.items():
+        if effect not in EFFECTS:
+            raise ValueError(f"Unknown effect '{effect}'")
+        value = float(value)
+        if effect not in (SPEED, PITCH) and value < 0:
+            raise ValueError(f"'{effect}' can't be negative")
+        if value != EFFECTS[effect]:
+            cleaned[effect] = value
+    if not MIN_RATE <= playback_rate(cleaned) <= MAX_RATE:
+        raise ValueError(f"Speed and pitch together must stay between {MIN_RATE}x and {MAX_RATE}x")
+    return cleaned
+
+
+def effects_key(effects):
+    return tuple(sorted(effects.items()))
+
+
+def playback_rate(effects):
+    return effects.get(SPEED, 1.0) * 2 ** (effects.get(PITCH, 0.0) / 12)
+
+
+def apply_effects(samples, sample_rate, effects):
+    """Returns float32 (frames, channels) samples trimmed, resampled for speed/pitch and faded.
+
+    Trims are measured in the source, fades in the output as it is heard.
+    """
+    start = round(effects.get(START, 0.0) * sample_rate)
+    end = len(samples) - round(effects.get(END, 0.0) * sample_rate)
+    samples = samples[start:max(start, end)]
+
+    rate = playback_rate(effects)
+    if rate != 1.0 and len(samples) > 1:
+        # Read the source `rate` frames per output frame, interpolating linearly
+        positions = np.arange(0, len(samples) - 1, rate)
+        index = positions.astype(np.int64)
+        fraction = (positions - index).astype(np.float32)[:, np.newaxis]
+        samples = samples[index] * (1 - fraction) + samples[index + 1] * fraction
+    else:
+        samples = samples.copy()
+
+    fade_in = min(len(samples), round(effects.get(FADE_IN, 0.0) * sample_rate))
+    if fade_in:
+        samples[:fade_in] *= np.linspace(0, 1, fade_in, endpoint=False, dtype=np.float32)[:, np.newaxis]
+    fade_out = min(len(samples), round(effects.get(FADE_OUT, 0.0) * sample_rate))
+    if fade_out:
+        samples[len(samples) - fade_out:] *= np.linspace(1, 0, fade_out, dtype=np.float32)[:, np.newaxis]
+    return samples
+
+
+def make_sound(samples):
+    """Turns float32 (frames, channels) samples into a Sound in the mixer's format."""
+    _, sample_format, channels = pygame.mixer.get_init()
+    if sample_format < 0:
+        info = np.iinfo(f"i{-sample_format // 8}")
+        pcm = np.round(np.clip(samples, -1, 1) * info.max).astype(info.dtype)
+    else:
+        pcm = samples.astype(np.float32)
+    if channels == 1:
+        pcm = pcm[:, 0]
+    return pygame.sndarray.make_sound(np.ascontiguousarray(pcm))
+
+
+class VariantCache(BudgetedCache, ReportsErrors):
+    """Keeps sounds rendered through tiles' effects, so a trigger plays a ready buffer with no DSP.
+
+    Variants are keyed by source file and effect parameters; the decoded
+    source comes from the sample cache.
+    """
+
+    def __init__(self, sample_cache, budget_bytes=DEFAULT_VARIANT_BUDGET_BYTES):
+        # Entries are keyed by (path, effects key)
+        super().__init__(budget_bytes)
+        self.sample_cache = sample_cache
+        self.renders = 0
+
+    @staticmethod
+    def path_of(entry_key):
+        return entry_key[0]
+
+    def get(self, file_path, effects):
+        """Returns a file's sound with effects applied, rendering it on a miss."""
+        source_key = SampleCache.make_key(file_path)
+        key = (source_key[0], effects_key(effects))
+        sound = self._lookup(key, source_key)
+        if sound is None:
+            sound = self.render(file_path, effects)
+            self._store(key, source_key, sound)
+        return sound
+
+    def render(self, file_path, effects):
+        source = self.sample_cache.load(file_path)
+        start = time.perf_counter()
+        samples = apply_effects(sound_samples(source), pygame.mixer.get_init()[0], effects)
+        if not len(samples):
+            # pygame crashes playing an empty Sound
+            raise ValueError("its trims leave no audio")
+        sound = make_sound(samples)
+        METRICS.observe("render_effects", time.perf_counter() - start)
+        self.renders += 1
+        return sound
+
+    def prepare(self, items):
+        """Renders (path, effects) variants that aren't cached yet on a background thread and returns it."""
+        items = [(path, effects) for path, effects in items if path and effects]
+
+        def worker():
+            for path, effects in items:
+                source_key = SampleCache.make_key(path)
+                key = (source_key[0], effects_key(effects))
+                if self._lookup(key, source_key, count=False) is not None:
+                    continue
+                try:
+                    self._store(key, source_key, self.render(path, effects))
+                except (pygame.error, OSError, ValueError) as e:
+                    self._report_error("Effects Error", f"Could not render effects for '{os.path.basename(path)}': {e}")
+
+        thread = threading.Thread(target=worker, name="variant-render", daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, file_path, effects):
+        """Drops one variant, e.g. after its tile's effects changed."""
+        self._drop((os.path.abspath(file_path), effects_key(effects)))
+
+    def stats(self):
+        return dict(super().stats(), renders=self.renders)
@@ -0,0 +1,571 @@
+import os
+import time
+import threading
+
+from effects import VariantCache, clean_effects, START, END, FADE_IN, STREAM_EFFECTS
+from hotkeys import HotkeyDispatcher, GLOBAL_BANK, BANK_PREFIX
+from importer import estimate_duration
+from journal import EventJournal, TRIGGER, STOP, VOLUME
+from loudness import LoudnessAnalyzer, db_to_gain, gain_to_db
+from metrics import METRICS
+from peaks import PeakCache
+from sample_cache import SampleCache
+from store import BoardStore, DEFAULT_BOARD
+from streaming import StreamPlayer, AUTO, STREAM, PLAYBACK_MODES
+from voice_engine import VoiceEngine, OVERLAP, CHOKE, POLICIES, DEFAULT_MAX_VOICES, STEAL_OLDEST, STEAL_POLICIES
+from lazy import LazyModule
+
+pygame = LazyModule("pygame")
+
+
+# Name reserved in the key bindings for the "New" tile action
+NEW_TILE = "New"
+
+# Default audio device settings for start_audio()
+AUDIO_FREQUENCY = 44100
+AUDIO_BUFFER = 512
+AUDIO_CHANNELS = 2
+# How long a trigger waits for a device that is still opening
+AUDIO_START_TIMEOUT = 5.0
+
+
+class SoundBoardEngine:
+    """Owns the sound library, key bindings and playback, independent of any UI."""
+
+    def __init__(self, data_dir=".", sample_cache=None, voice_engine=None, defer_audio=False, board=DEFAULT_BOARD,
+                 max_voices=DEFAULT_MAX_VOICES, steal_policy=STEAL_OLDEST):
+        if steal_policy not in STEAL_POLICIES:
+            raise ValueError(f"Unknown voice-stealing policy '{steal_policy}'")
+        self.data_dir = data_dir
+        self.error_handlers = []
+        # Startup phase -> milliseconds it took
+        self.timings = {}
+        # The engine is driven from the UI thread, the trigger server and the
+        # store's writer thread, so state changes happen under this lock
+        self._lock = threading.RLock()
+        self.store = BoardStore(data_dir, on_error=self.report_error)
+        # Only the open board is held in memory; the others are just names in the store
+        self.board = board
+        data = self.store.load(board)
+        self.sounds = data["sounds"]
+        self.key_bindings = data["key_bindings"]
+        self.tile_settings = data["tile_settings"]
+        self.store.attach(self.snapshot)
+        # Key presses go through one precompiled dispatch table
+        self.hotkeys = HotkeyDispatcher(on_action=self.run_action)
+        self.hotkeys.compile(self.key_bindings, self.bank_of)
+        self.action_handlers = {}
+        self.bank_handlers = []
+        self.board_handlers = []
+        self.sample_cache = sample_cache if sample_cache is not None else SampleCache()
+        # Tiles with effects play pre-rendered variants of their sound
+        self.variants = VariantCache(self.sample_cache)
+        # The voice pool is created with the mixer, so its size and stealing policy wait here
+        self.voice_engine = voice_engine
+        self.max_voices = max_voices
+        self.steal_policy = steal_policy
+        self.master_volume = 1.0
+        # A trigger slower than one mixer buffer misses the next audio callback
+        self.buffer_seconds = AUDIO_BUFFER / AUDIO_FREQUENCY
+        self.streamer = StreamPlayer()
+        self.loudness = LoudnessAnalyzer(data_dir, self.sample_cache)
+        # Called with the tile names whose waveform just became available
+        self.peak_handlers = []
+        self.peaks = PeakCache(data_dir, self.sample_cache)
+        self.peaks.on_ready = self._peaks_ready
+        # Every trigger, stop and volume change, for replaying a session later
+        self.journal = EventJournal()
+        # Errors on the components' background threads reach the same handlers
+        for component in (self.sample_cache, self.variants, self.streamer, self.loudness, self.peaks, self.journal):
+            component.on_error = self.report_error
+        # With defer_audio the mixer is opened later by start_audio(), off the UI thread
+        self.audio_ready = threading.Event()
+        # Why the device could not be opened, once start_audio() has given up
+        self.audio_error = None
+        # Set once the device is open or has failed, so nothing waits for a device that won't come
+        self._audio_settled = threading.Event()
+        if not defer_audio:
+            self._audio_started()
+
+    def report_error(self, title, message):
+        """Passes an error to the registered handlers, or prints it when there are none."""
+        METRICS.count("errors")
+        if not self.error_handlers:
+            print(f"{title}: {message}")
+        for handler in self.error_handlers:
+            handler(title, message)
+
+    # Audio device
+
+    def start_audio(self, frequency=AUDIO_FREQUENCY, buffer=AUDIO_BUFFER, channels=AUDIO_CHANNELS):
+        """Opens the audio device on a background thread and returns the thread."""
+        def worker():
+            started = time.perf_counter()
+            try:
+                pygame.mixer.init(frequency=frequency, size=-16, channels=channels, buffer=buffer)
+            except pygame.error as e:
+                self.audio_error = f"Could not open the audio device: {e}"
+                self._audio_settled.set()
+                self.report_error("Audio Error", self.audio_error)
+                return
+            self.timings["audio_device"] = (time.perf_counter() - started) * 1000
+            self.buffer_seconds = buffer / frequency
+            self._audio_started()
+
+        thread = threading.Thread(target=worker, name="audio-start", daemon=True)
+        thread.start()
+        return thread
+
+    def _audio_started(self):
+        with self._lock:
+            if self.voice_engine is None:
+                self.voice_engine = VoiceEngine(self.max_voices, self.steal_policy)
+            self.voice_engine.set_master_volume(self.master_volume)
+            self.streamer.set_master_volume(self.master_volume)
+            # Set under the lock so a concurrent set_volume() isn't lost
+            self.audio_ready.set()
+            self._audio_settled.set()
+
+    def wait_for_audio(self, timeout=None):
+        """Waits until the audio device is open; returns False if it failed or isn't open within `timeout`."""
+        self._audio_settled.wait(timeout)
+        return self.audio_ready.is_set()
+
+    # Persistence
+
+    def snapshot(self):
+        """Returns a consistent copy of everything the store saves."""
+        with self._lock:
+            return {
+                "board": self.board,
+                "sounds": dict(self.sounds),
+                "key_bindings": dict(self.key_bindings),
+                "tile_settings": {name: dict(settings) for name, settings in self.tile_settings.items()},
+            }
+
+    def close(self):
+        """Writes out any unsaved changes and the rest of the event journal."""
+        self.store.close()
+        self.journal.close()
+
+    def preload(self):
+        """Starts preparing every sound in the library in the background."""
+        return self.warm(list(self.sounds), phase="preload")
+
+    def warm(self, names, phase=None):
+        """Decodes resident tiles, reads ahead streamed ones and queues loudness and waveform analysis, off-thread.
+
+        With `phase`, the time until everything is decoded is recorded in `timings`.
+        """
+        items = [(name, self.sounds[name]) for name in names if self.sounds.get(name)]
+
+        def worker():
+            started = time.perf_counter()
+            # Opening the peaks file imports NumPy, so it happens here rather than on the UI thread
+            if not self.peaks.opened:
+                self.peaks.open()
+                self._peaks_ready(None)
+            if not self.wait_for_audio():
+                # Nothing can be decoded without a mixer
+                return
+            resident, streamed, variants = [], [], []
+            for name, path in items:
+                try:
+                    mode = self.playback_mode(name, path)
+                except OSError as e:
+                    self.report_error("Preload Error", f"Could not prepare '{os.path.basename(path)}': {e}")
+                    continue
+                (streamed if mode == STREAM else resident).append(path)
+                effects = self.tile_settings.get(name, {}).get("effects")
+                if effects and mode != STREAM:
+                    variants.append((path, effects))
+            self.loudness.analyze(resident)
+            # Streamed files are decoded once for the analysis but not kept
+            self.loudness.analyze(streamed, keep=False)
+            self.peaks.request(resident)
+            self.peaks.request(streamed, keep=False)
+            self.sample_cache.preload(resident).join()
+            self.variants.prepare(variants).join()
+            self.streamer.read_ahead(streamed).join()
+            if phase is not None:
+                self.timings[phase] = (time.perf_counter() - started) * 1000
+
+        thread = threading.Thread(target=worker, name="tile-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    # Library
+
+    def add_sound(self, name, path):
+        with self._lock:
+            self.sounds[name] = path
+            self._admit([path])
+        self.store.mark_dirty()
+        self.warm([name])
+
+    def add_sounds(self, results):
+        """Adds probed files from an import in one go and returns the tile names used."""
+        names = []
+        with self._lock:
+            for result in results:
+                name = self.unique_name(result["name"])
+                self.sounds[name] = result["path"]
+                names.append(name)
+            self._admit([result["path"] for result in results])
+        for result in results:
+            # Long files were decoded to validate them, but are streamed from now on
+            if "sound" in result and self.streamer.mode_for(result["path"]) != STREAM:
+                self.sample_cache.put(result["path"], result["sound"])
+        self.warm(names)
+        return names
+
+    def _admit(self, paths):
+        # New sounds of the open board may be cached even after a board switch narrowed the caches
+        self.sample_cache.admit(paths)
+        self.variants.admit(paths)
+        self.streamer.admit(paths)
+
+    def _peaks_ready(self, path):
+        if path is None:
+            # Every stored waveform became readable at once
+            names = None
+        else:
+            with self._lock:
+                names = [name for name, sound_path in self.sounds.items() if sound_path == path]
+        for handler in self.peak_handlers:
+            handler(names)
+
+    def unique_name(self, name):
+        """Returns `name`, or `name (2)`, `name (3)`... if it is already taken."""
+        candidate = name
+        counter = 2
+        while candidate in self.sounds:
+            candidate = f"{name} ({counter})"
+            counter += 1
+        return candidate
+
+    def rename_sound(self, old_name, new_name):
+        """Renames a sound, carrying its key binding and settings along."""
+        with self._lock:
+            self.sounds[new_name] = self.sounds.pop(old_name)
+            if old_name in self.tile_settings:
+                self.tile_settings[new_name] = self.tile_settings.pop(old_name)
+            if old_name in self.key_bindings:
+                self.key_bindings[new_name] = self.key_bindings.pop(old_name)
+                self.hotkeys.unbind(old_name)
+                self.hotkeys.bind(new_name, self.key_bindings[new_name], self.bank_of(new_name))
+        self.store.mark_dirty()
+
+    def remove_sound(self, name):
+        """Removes a sound and returns the key that was bound to it, if any."""
+        with self._lock:
+            path = self.sounds.pop(name, None)
+            key = self.key_bindings.pop(name, None)
+            settings = self.tile_settings.pop(name, None) or {}
+            self.hotkeys.unbind(name)
+            self._drop_variant(path, settings.get("effects"))
+        self.store.mark_dirty()
+        return key
+
+    def set_tile_policy(self, name, policy, choke_group=None):
+        """Sets how a tile behaves when triggered while other sounds are playing."""
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown playback mode '{policy}'")
+        with self._lock:
+            settings = self.tile_settings.setdefault(name, {})
+            if policy == CHOKE:
+                settings["choke_group"] = choke_group
+            settings["policy"] = policy
+        self.store.mark_dirty()
+
+    def set_tile_priority(self, name, priority):
+        """Sets how much a tile's voices are protected when the voice pool is full and steals by priority."""
+        with self._lock:
+            settings = self.tile_settings.setdefault(name, {})
+            if priority:
+                settings["priority"] = int(priority)
+            else:
+                settings.pop("priority", None)
+        self.store.mark_dirty()
+
+    def playback_mode(self, name, file_path):
+        """Returns whether a tile plays from memory (RESIDENT) or is streamed (STREAM)."""
+        mode = self.tile_settings.get(name, {}).get("playback", AUTO)
+        return self.streamer.mode_for(file_path) if mode == AUTO else mode
+
+    def set_tile_playback(self, name, mode):
+        """Forces a tile to be resident or streamed, or lets its length decide (AUTO)."""
+        if mode not in PLAYBACK_MODES:
+            raise ValueError(f"Unknown playback type '{mode}'")
+        path = self.sounds.get(name)
+        if path:
+            streamed = (self.streamer.mode_for(path) if mode == AUTO else mode) == STREAM
+            self._check_stream_effects(name, streamed, self.tile_settings.get(name, {}).get("effects", {}))
+        with self._lock:
+            settings = self.tile_settings.setdefault(name, {})
+            if mode == AUTO:
+                settings.pop("playback", None)
+            else:
+                settings["playback"] = mode
+            path = self.sounds.get(name)
+            if path and self.playback_mode(name, path) == STREAM:
+                self.sample_cache.invalidate(path)
+        self.store.mark_dirty()
+        self.warm([name])
+
+    def set_tile_trim(self, name, trim_db):
+        """Sets a tile's gain offset in dB, applied on top of loudness normalization."""
+        with self._lock:
+            settings = self.tile_settings.setdefault(name, {})
+            if trim_db:
+                settings["trim_db"] = float(trim_db)
+            else:
+                settings.pop("trim_db", None)
+        self.store.mark_dirty()
+
+    def trim_headroom_db(self, name):
+        """Returns how many dB a trim can raise a tile before its volume is capped at 1.0."""
+        path = self.sounds.get(name)
+        gain = self.loudness.gain_for(path) if path else 1.0
+        return max(0.0, -gain_to_db(gain))
+
+    def set_tile_effects(self, name, effects):
+        """Sets a tile's effects (see effects.EFFECTS); raises ValueError for unknown or invalid ones.
+
+        The tile's variant is re-rendered in the background; variants of other tiles are kept.
+        """
+        effects = clean_effects(effects)
+        path = self.sounds.get(name)
+        if path:
+            self._check_stream_effects(name, self.playback_mode(name, path) == STREAM, effects)
+        trimmed = effects.get(START, 0.0) + effects.get(END, 0.0)
+        if path and trimmed:
+            try:
+                duration = estimate_duration(path)
+            except (OSError, ValueError, KeyError):
+                # Unknown length; rendering the variant refuses an empty result instead
+                duration = None
+            if duration is not None and trimmed >= duration:
+                raise ValueError(f"Trims of {trimmed:g}s leave nothing of the {duration:.2f}s clip")
+        with self._lock:
+            settings = self.tile_settings.setdefault(name, {})
+            old_effects = settings.pop("effects", None)
+            if effects:
+                settings["effects"] = effects
+            self._drop_variant(self.sounds.get(name), old_effects)
+        self.store.mark_dirty()
+        self.warm([name])
+
+    def _check_stream_effects(self, name, streamed, effects):
+        """Raises ValueError if a streamed tile would have effects that streaming can't apply."""
+        unsupported = [effect for effect in effects if effect not in STREAM_EFFECTS]
+        if streamed and unsupported:
+            raise ValueError(
+                f"'{name}' is streamed, which only supports {' and '.join(STREAM_EFFECTS)}; "
+                f"load it into memory to use {', '.join(unsupported)}"
+            )
+
+    def _drop_variant(self, path, effects):
+        # Another tile may play the same file with the same effects
+        if path and effects and not any(
+            self.sounds.get(other) == path and settings.get("effects") == effects
+            for other, settings in self.tile_settings.items()
+        ):
+            self.variants.invalidate(path, effects)
+
+    def tile_gain(self, file_path, name=None):
+        """Returns the channel volume for a tile: normalization gain times its trim, at most 1.0."""
+        gain = self.loudness.gain_for(file_path)
+        trim_db = self.tile_settings.get(name, {}).get("trim_db")
+        if trim_db:
+            gain *= db_to_gain(trim_db)
+        return min(gain, 1.0)
+
+    def bank_of(self, name):
+        """Returns the bank a tile's key binding belongs to."""
+        return self.tile_settings.get(name, {}).get("bank", GLOBAL_BANK)
+
+    def set_tile_bank(self, name, bank):
+        """Moves a tile to a bank; raises ValueError if its key is taken there."""
+        with self._lock:
+            if name in self.key_bindings:
+                self.hotkeys.bind(name, self.key_bindings[name], bank)
+            settings = self.tile_settings.setdefault(name, {})
+            if bank:
+                settings["bank"] = bank
+            else:
+                settings.pop("bank", None)
+        self.store.mark_dirty()
+
+    def banks(self):
+        """Returns the names of all banks in use, besides the global one."""
+        names = {settings["bank"] for settings in self.tile_settings.values() if settings.get("bank")}
+        names.update(name[len(BANK_PREFIX):] for name in self.key_bindings if name.startswith(BANK_PREFIX))
+        return sorted(names)
+
+    def switch_bank(self, bank):
+        self.hotkeys.set_bank(bank)
+        for handler in self.bank_handlers:
+            handler(bank)
+
+    # Boards
+
+    def boards(self):
+        return self.store.boards()
+
+    def switch_board(self, board, preload=True):
+        """Saves the open board and opens another. Only audio the two boards share stays decoded.
+
+        With preload=False the new board's sounds are left for a later preload().
+        """
+        if board == self.board:
+            return
+        if board not in self.store.boards():
+            raise ValueError(f"There is no board named '{board}'")
+        data = self.store.load(board)
+        with self._lock:
+            # Written under the lock so no change to the old board is lost or saved into the new one
+            self.store.flush()
+            self.board = board
+            self.sounds = data["sounds"]
+            self.key_bindings = data["key_bindings"]
+            self.tile_settings = data["tile_settings"]
+            self.hotkeys.compile(self.key_bindings, self.bank_of)
+            paths = list(self.sounds.values())
+            self.sample_cache.retain(paths)
+            self.variants.retain(paths)
+            self.streamer.retain(paths)
+        for handler in self.board_handlers:
+            handler(board)
+        self.switch_bank(GLOBAL_BANK)
+        if preload:
+            self.preload()
+
+    def create_board(self, board):
+        """Creates an empty board and opens it; raises ValueError if the name is unusable or taken."""
+        self.store.create_board(board)
+        self.switch_board(board)
+
+    def delete_board(self, board):
+        """Deletes a board, opening the default one first if it is open."""
+        if board == self.board:
+            self.switch_board(DEFAULT_BOARD)
+        self.store.delete_board(board)
+
+    # Key bindings
+
+    def binding_owner(self, key, name=None):
+        """Returns the action whose binding clashes with `key`, or None."""
+        return self.hotkeys.find_conflict(key, self.bank_of(name), ignore=name)
+
+    def set_binding(self, name, key):
+        """Binds a key to a sound, the 'New' action or a bank switch; raises ValueError on conflicts."""
+        with self._lock:
+            self.hotkeys.bind(name, key, self.bank_of(name))
+            self.key_bindings[name] = key
+        self.store.mark_dirty()
+
+    def remove_binding(self, name):
+        """Removes the key bound to an action and returns it, or None."""
+        with self._lock:
+            key = self.key_bindings.pop(name, None)
+            self.hotkeys.unbind(name)
+        if key is not None:
+            self.store.mark_dirty()
+        return key
+
+    def run_action(self, action):
+        """Runs the action a hotkey resolved to."""
+        if action.startswith(BANK_PREFIX):
+            self.switch_bank(action[len(BANK_PREFIX):])
+        elif action in self.action_handlers:
+            self.action_handlers[action]()
+        elif action in self.sounds:
+            self.trigger(action)
+
+    # Playback
+
+    def trigger(self, name):
+        """Plays a sound by tile name. Returns False if there is no such sound."""
+        path = self.sounds.get(name)
+        self.journal.record(TRIGGER, name, path)
+        if not path:
+            return False
+        return self._play(path, name)
+
+    def play_file(self, file_path, name=None):
+        self.journal.record(TRIGGER, name, file_path)
+        return self._play(file_path, name)
+
+    def _play(self, file_path, name):
+        start = time.perf_counter()
+        played = self._start_playback(file_path, name)
+        elapsed = time.perf_counter() - start
+        METRICS.observe("trigger", elapsed)
+        if elapsed > self.buffer_seconds:
+            METRICS.count("late_triggers")
+        return played
+
+    def _start_playback(self, file_path, name):
+        if not self.wait_for_audio(AUDIO_START_TIMEOUT):
+            self.report_error("Playback Error", self.audio_error or "The audio device is not ready yet.")
+            return False
+        settings = self.tile_settings.get(name, {})
+        try:
+            with self._lock:
+                effects = settings.get("effects")
+                if self.playback_mode(name, file_path) == STREAM:
+                    # Streams can only skip ahead and fade in; other effects need a resident tile
+                    effects = effects or {}
+                    self.streamer.play(file_path, gain=self.tile_gain(file_path, name), start=effects.get(START, 0.0), fade_in=effects.get(FADE_IN, 0.0))
+                    return True
+                sound = self.variants.get(file_path, effects) if effects else self.sample_cache.get(file_path)
+                if sound.get_length() == 0:
+                    # pygame crashes playing an empty Sound
+                    raise ValueError("it has no audio")
+                self.voice_engine.play(
+                    sound,
+                    file_path,
+                    policy=settings.get("policy", OVERLAP),
+                    choke_group=settings.get("choke_group"),
+                    priority=settings.get("priority", 0),
+                    gain=self.tile_gain(file_path, name),
+                )
+            return True
+        except (pygame.error, FileNotFoundError, ValueError) as e:
+            self.report_error("Playback Error", f"Could not play sound '{os.path.basename(file_path)}': {e}")
+        except Exception as e:
+            self.report_error("Unexpected Error", f"An unexpected error occurred during playback: {e}")
+        return False
+
+    def stop_all(self):
+        self.journal.record(STOP)
+        with self._lock:
+            if self.voice_engine is not None:
+                self.voice_engine.stop_all()
+            self.streamer.stop()
+
+    def set_volume(self, volume):
+        self.journal.record(VOLUME, value=float(volume))
+        with self._lock:
+            self.master_volume = float(volume)
+            if self.audio_ready.is_set():
+                self.voice_engine.set_master_volume(self.master_volume)
+                self.streamer.set_master_volume(self.master_volume)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "board": self.board,
+                "sounds": len(self.sounds),
+                "cache": self.sample_cache.stats(),
+                "variants": self.variants.stats(),
+                "stream": self.streamer.stats(),
+                "store": self.store.stats(),
+                "voices": self.voice_engine.stats() if self.voice_engine is not None else None,
+                "hotkeys": self.hotkeys.stats(),
+                "journal": self.journal.stats(),
+                "loudness": {"analyzed": self.loudness.analyzed, "normalized": len(self.loudness.gains)},
+                "startup": dict(self.timings),
+                "metrics": METRICS.snapshot(),
+            }
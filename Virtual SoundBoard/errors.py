@@ -0,0 +1,14 @@
+class ReportsErrors:
+    """Mixin for components whose background threads can fail.
+
+    The engine points on_error at its report_error, so failures reach the
+    UI's status line; without it they are printed.
+    """
+
+    on_error = None
+
+    def _report_error(self, title, message):
+        if self.on_error is not None:
+            self.on_error(title, message)
+        else:
+            print(f"{title}: {message}")
@@ -0,0 +1,256 @@
+import time
+from collections import deque
+
+from metrics import summarize
+
+# Key binding syntax: steps separated by spaces. A step is a Tk-style key
+# ("4", "<F1>", "<Control-k>") or "+"-joined keys that are held together
+# ("ctrl+shift+a", "a+s"). "<Control-k> 1" is a two-step sequence.
+
+# Seconds allowed between the steps of a sequence
+SEQUENCE_TIMEOUT = 1.0
+
+# Bank that is always active; tiles without a bank live here
+GLOBAL_BANK = ""
+
+# Key binding actions named like this switch the active bank
+BANK_PREFIX = "bank:"
+
+MODIFIER_ALIASES = {
+    "control": "ctrl", "ctrl": "ctrl",
+    "shift": "shift",
+    "alt": "alt", "option": "alt", "mod1": "alt",
+    "meta": "meta", "command": "meta", "cmd": "meta", "super": "meta", "win": "meta",
+}
+
+# Keysyms of the modifier keys themselves, as reported by Tk
+MODIFIER_KEYSYMS = {
+    "control_l": "ctrl", "control_r": "ctrl",
+    "shift_l": "shift", "shift_r": "shift",
+    "alt_l": "alt", "alt_r": "alt", "option_l": "alt", "option_r": "alt",
+    "meta_l": "meta", "meta_r": "meta", "super_l": "meta", "super_r": "meta",
+    "win_l": "meta", "win_r": "meta",
+}
+
+# Tk event-type prefixes that may appear in "<KeyPress-a>"-style bindings
+EVENT_TYPES = {"key", "keypress"}
+
+LATENCY_SAMPLES = 1000
+
+
+def parse_step(text):
+    """Parses one step of a binding into (modifiers, keys) frozensets."""
+    if text.startswith("<") and text.endswith(">") and len(text) > 2:
+        parts = text[1:-1].split("-")
+        if len(parts) > 1 and parts[-1] == "":
+            # "<Control-->" binds the minus key
+            parts = parts[:-2] + ["minus"]
+    else:
+        parts = text.split("+") if len(text) > 1 else [text]
+    modifiers, keys = set(), set()
+    for part in parts:
+        lowered = part.lower()
+        if lowered in MODIFIER_ALIASES:
+            modifiers.add(MODIFIER_ALIASES[lowered])
+        elif lowered in EVENT_TYPES:
+            continue
+        elif lowered:
+            keys.add(lowered)
+    if not keys:
+        raise ValueError(f"Key binding '{text}' has no key")
+    return frozenset(modifiers), frozenset(keys)
+
+
+def parse_binding(text):
+    """Parses a binding string into a tuple of steps."""
+    steps = tuple(parse_step(step) for step in text.split())
+    if not steps:
+        raise ValueError("Key binding is empty")
+    return steps
+
+
+class _Node:
+    __slots__ = ("action", "children")
+
+    def __init__(self):
+        self.action = None
+        self.children = {}
+
+
+class HotkeyDispatcher:
+    """Maps key events to actions through a per-bank trie of binding steps.
+
+    A key press costs a couple of dict lookups no matter how many sounds are
+    bound, and conflicts are found by walking the trie instead of scanning
+    every binding.
+    """
+
+    def __init__(self, on_action=None):
+        self.on_action = on_action
+        self.active_bank = GLOBAL_BANK
+        self.tries = {GLOBAL_BANK: _Node()}
+        self.bound = {}  # action -> (bank, steps)
+        self.held_keys = set()
+        self.held_modifiers = set()
+        self._nodes = None  # nodes reached by the current sequence, or None at the roots
+        self._last_step = 0.0
+        self.dispatches = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    # Building the table
+
+    def compile(self, key_bindings, bank_of=None):
+        """Rebuilds the whole table from {action: binding} and an optional action -> bank function."""
+        self.tries = {GLOBAL_BANK: _Node()}
+        self.bound = {}
+        self._nodes = None
+        for action, binding in key_bindings.items():
+            if not binding:
+                continue
+            bank = bank_of(action) if bank_of is not None else GLOBAL_BANK
+            try:
+                self.bind(action, binding, bank)
+            except ValueError as e:
+                print(f"Skipping key binding '{binding}' for '{action}': {e}")
+
+    def find_conflict(self, binding, bank=GLOBAL_BANK, ignore=None):
+        """Returns the action whose binding clashes with this one, or None."""
+        steps = parse_binding(binding)
+        banks = [bank, GLOBAL_BANK] if bank != GLOBAL_BANK else list(self.tries)
+        for trie_bank in banks:
+            conflict = self._conflict_in(self.tries.get(trie_bank), steps, ignore)
+            if conflict is not None:
+                return conflict
+        return None
+
+    def _conflict_in(self, node, steps, ignore):
+        if node is None:
+            return None
+        for step in steps:
+            node = node.children.get(step)
+            if node is None:
+                return None
+            if node.action is not None and node.action != ignore:
+                # An existing binding equals this one or is a prefix of it
+                return node.action
+        # This binding would be a prefix of a longer one
+        for action in self._actions_below(node):
+            if action != ignore:
+                return action
+        return None
+
+    def _actions_below(self, node):
+        stack = list(node.children.values())
+        while stack:
+            child = stack.pop()
+            if child.action is not None:
+                yield child.action
+            stack.extend(child.children.values())
+
+    def bind(self, action, binding, bank=GLOBAL_BANK):
+        """Adds or replaces the binding for an action; raises ValueError on conflicts."""
+        steps = parse_binding(binding)
+        conflict = self.find_conflict(binding, bank, ignore=action)
+        if conflict is not None:
+            raise ValueError(f"Key '{binding}' is already assigned to '{conflict}'.")
+        self.unbind(action)
+        node = self.tries.setdefault(bank, _Node())
+        for step in steps:
+            node = node.children.setdefault(step, _Node())
+        node.action = action
+        self.bound[action] = (bank, steps)
+
+    def unbind(self, action):
+        """Removes an action's binding and prunes the empty trie branch."""
+        if action not in self.bound:
+            return
+        bank, steps = self.bound.pop(action)
+        path = [self.tries[bank]]
+        for step in steps:
+            path.append(path[-1].children[step])
+        path[-1].action = None
+        for depth in range(len(steps), 0, -1):
+            node = path[depth]
+            if node.action is None and not node.children:
+                del path[depth - 1].children[steps[depth - 1]]
+        self._nodes = None
+
+    def set_bank(self, bank):
+        self.active_bank = bank
+        self._nodes = None
+
+    # Dispatching
+
+    def key_press(self, keysym, now=None):
+        """Handles a key press and returns the action it fired, if any."""
+        start = time.perf_counter()
+        key = keysym.lower()
+        modifier = MODIFIER_KEYSYMS.get(key)
+        if modifier is not None:
+            self.held_modifiers.add(modifier)
+            return None
+        if key in self.held_keys:
+            # Auto-repeat of a key that is still held down
+            return None
+        self.held_keys.add(key)
+
+        now = time.monotonic() if now is None else now
+        if self._nodes is not None and now - self._last_step > SEQUENCE_TIMEOUT:
+            self._nodes = None
+        self._last_step = now
+
+        action = self._step(frozenset(self.held_modifiers), frozenset(self.held_keys), key)
+        if action is not None:
+            self.dispatches += 1
+            self.latencies.append(time.perf_counter() - start)
+            if self.on_action is not None:
+                self.on_action(action)
+        return action
+
+    def key_release(self, keysym):
+        key = keysym.lower()
+        modifier = MODIFIER_KEYSYMS.get(key)
+        if modifier is not None:
+            self.held_modifiers.discard(modifier)
+        else:
+            self.held_keys.discard(key)
+
+    def reset(self):
+        """Forgets held keys and any half-typed sequence, e.g. when the window loses focus."""
+        self.held_keys.clear()
+        self.held_modifiers.clear()
+        self._nodes = None
+
+    def _roots(self):
+        roots = []
+        if self.active_bank != GLOBAL_BANK and self.active_bank in self.tries:
+            roots.append(self.tries[self.active_bank])
+        roots.append(self.tries[GLOBAL_BANK])
+        return roots
+
+    def _step(self, modifiers, keys, key):
+        from_roots = self._nodes is None
+        nodes = self._roots() if from_roots else self._nodes
+        # Prefer the full chord of held keys, then the key that was just pressed
+        candidates = [(modifiers, keys)]
+        if len(keys) > 1:
+            candidates.append((modifiers, frozenset((key,))))
+        for step in candidates:
+            matched = [node.children[step] for node in nodes if step in node.children]
+            if not matched:
+                continue
+            for node in matched:
+                if node.action is not None:
+                    self._nodes = None
+                    return node.action
+            self._nodes = matched
+            return None
+        self._nodes = None
+        if not from_roots:
+            # The sequence broke off; this key may start a new one
+            return self._step(modifiers, keys, key)
+        return None
+
+    def stats(self):
+        """Returns dispatch counts and latency in milliseconds."""
+        return dict(summarize(self.latencies, (0.99,)), bindings=len(self.bound), dispatches=self.dispatches)
@@ -0,0 +1,267 @@
+import os
+import queue
+import struct
+import threading
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy import LazyModule
+
+pygame = LazyModule("pygame")
+
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg")
+BATCH_SIZE = 25
+# Files probed ahead of the one being collected, per worker; each holds its decoded audio
+PROBE_AHEAD_PER_WORKER = 2
+HEADER_SCAN_BYTES = 64 * 1024
+
+MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
+
+# Bitrates in kbps by (MPEG-1?, layer bits) and bitrate index
+MPEG_BITRATES = {
+    (True, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),  # Layer I
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),     # Layer II
+    (True, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),      # Layer III
+    (False, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+def scan_folder(folder, recursive=True, on_error=None):
+    """Returns the audio files in a folder (and its subfolders) in a stable order.
+
+    Folders that can't be read are passed to on_error(path, message), or printed without it.
+    """
+    found = []
+    pending = [folder]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name.lower())
+        except OSError as e:
+            if on_error is not None:
+                on_error(directory, f"Could not scan folder: {e}")
+            else:
+                print(f"Could not scan '{directory}': {e}")
+            continue
+        subfolders = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    subfolders.append(entry.path)
+            elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                found.append(entry.path)
+        pending.extend(reversed(subfolders))
+    return found
+
+
+def read_header(file_path):
+    """Reads format, sample rate and channel count from a file header without decoding it."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".wav":
+        try:
+            with wave.open(file_path, "rb") as f:
+                return {"format": "wav", "sample_rate": f.getframerate(), "channels": f.getnchannels()}
+        except wave.Error as e:
+            raise ValueError(f"not a valid WAV file ({e})")
+    with open(file_path, "rb") as f:
+        data = f.read(HEADER_SCAN_BYTES)
+    if extension == ".ogg":
+        return _read_ogg_header(data)
+    return _read_mp3_header(file_path, data)
+
+
+def _read_ogg_header(data):
+    if not data.startswith(b"OggS"):
+        raise ValueError("not an Ogg file")
+    vorbis = data.find(b"\x01vorbis")
+    if vorbis != -1 and len(data) >= vorbis + 16:
+        channels, sample_rate = struct.unpack_from("<BI", data, vorbis + 11)
+        return {"format": "ogg/vorbis", "sample_rate": sample_rate, "channels": channels}
+    opus = data.find(b"OpusHead")
+    if opus != -1 and len(data) >= opus + 16:
+        channels = data[opus + 9]
+        sample_rate = struct.unpack_from("<I", data, opus + 12)[0]
+        return {"format": "ogg/opus", "sample_rate": sample_rate or 48000, "channels": channels}
+    raise ValueError("unsupported Ogg codec")
+
+
+def _read_mp3_header(file_path, data):
+    offset = 0
+    if data.startswith(b"ID3") and len(data) >= 10:
+        # ID3v2 size is a 28-bit "syncsafe" integer
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+        if offset + 4 > len(data):
+            with open(file_path, "rb") as f:
+                f.seek(offset)
+                data = f.read(HEADER_SCAN_BYTES)
+            offset = 0
+    while True:
+        offset = data.find(b"\xff", offset)
+        if offset == -1 or offset + 4 > len(data):
+            raise ValueError("no MPEG audio frame found")
+        b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+        version = (b1 >> 3) & 3
+        layer = (b1 >> 1) & 3
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 3
+        if (b1 & 0xE0) == 0xE0 and version != 1 and layer != 0 and bitrate_index != 0xF and rate_index != 3:
+            header = {
+                "format": "mp3",
+                "sample_rate": MPEG_SAMPLE_RATES[version][rate_index],
+                "channels": 1 if b3 >> 6 == 3 else 2,
+                "bitrate": MPEG_BITRATES[(version == 3, layer)][bitrate_index],
+                "samples_per_frame": 384 if layer == 3 else (1152 if version == 3 or layer == 2 else 576),
+            }
+            # Encoders put the total frame count in a Xing/Info or VBRI tag in the first frame
+            first_frame = data[offset:offset + 200]
+            for tag, count_offset in ((b"Xing", 8), (b"Info", 8), (b"VBRI", 14)):
+                position = first_frame.find(tag)
+                if position != -1 and position + count_offset + 4 <= len(first_frame):
+                    has_count = tag == b"VBRI" or struct.unpack_from(">I", first_frame, position + 4)[0] & 1
+                    if has_count:
+                        header["frames"] = struct.unpack_from(">I", first_frame, position + count_offset)[0]
+                    break
+            return header
+        offset += 1
+
+
+def estimate_duration(file_path, header=None):
+    """Estimates a file's length in seconds from its headers, without decoding it.
+
+    WAV, Ogg and tagged MP3 lengths are exact; untagged MP3 assumes a constant bitrate.
+    Returns None for an untagged free-format MP3.
+    """
+    header = header if header is not None else read_header(file_path)
+    if header["format"] == "wav":
+        with wave.open(file_path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    if header["format"] == "mp3":
+        if "frames" in header:
+            return header["frames"] * header["samples_per_frame"] / header["sample_rate"]
+        if not header["bitrate"]:
+            # Free-format stream: the bitrate isn't in the header, so the length is unknown
+            return None
+        return os.path.getsize(file_path) * 8 / (header["bitrate"] * 1000)
+    # The granule position of the last Ogg page is the total sample count
+    with open(file_path, "rb") as f:
+        f.seek(max(0, os.path.getsize(file_path) - HEADER_SCAN_BYTES))
+        data = f.read()
+    last_page = data.rfind(b"OggS")
+    if last_page == -1 or last_page + 14 > len(data):
+        raise ValueError("no Ogg page found")
+    samples = struct.unpack_from("<q", data, last_page + 6)[0]
+    sample_rate = 48000 if header["format"] == "ogg/opus" else header["sample_rate"]
+    return samples / sample_rate
+
+
+def probe_file(file_path, keep_sound=None):
+    """Validates one file: header, decodability and duration. Returns a result dict.
+
+    The decoded sound is returned under "sound" unless keep_sound(path) is
+    false, e.g. for files that will be streamed rather than held in memory.
+    """
+    result = {"path": file_path, "name": os.path.splitext(os.path.basename(file_path))[0]}
+    try:
+        result.update(read_header(file_path))
+        sound = pygame.mixer.Sound(file_path)
+        duration = sound.get_length()
+        if duration <= 0:
+            raise ValueError("file contains no audio")
+        result["duration"] = duration
+        if keep_sound is None or keep_sound(file_path):
+            result["sound"] = sound
+    except (OSError, ValueError, pygame.error) as e:
+        result["error"] = str(e)
+    return result
+
+
+class ImportJob:
+    """Scans a folder and probes its audio files on a thread pool, handing results back in batches.
+
+    The UI thread calls drain() periodically to pick up finished batches, so
+    scanning, header parsing and decoding never run on the Tk thread.
+    """
+
+    def __init__(self, folder, recursive=True, skip_paths=(), workers=None, batch_size=BATCH_SIZE, keep_sound=None):
+        self.folder = folder
+        self.recursive = recursive
+        self.skip_paths = {os.path.abspath(path) for path in skip_paths}
+        self.workers = workers or min(8, (os.cpu_count() or 2))
+        self.batch_size = batch_size
+        self.keep_sound = keep_sound
+        self.total = 0
+        self.done = 0
+        self.failed = []
+        self.finished = threading.Event()
+        self._cancelled = threading.Event()
+        self._batches = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="folder-import", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def drain(self):
+        """Returns every probed file that passed validation since the last call."""
+        accepted = []
+        while True:
+            try:
+                accepted.extend(self._batches.get_nowait())
+            except queue.Empty:
+                return accepted
+
+    def _run(self):
+        try:
+            paths = [path for path in scan_folder(self.folder, self.recursive, on_error=lambda path, message: self.failed.append((path, message))) if os.path.abspath(path) not in self.skip_paths]
+            self.total = len(paths)
+            batch = []
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # Only a window of files is probed ahead, so decoded audio for the
+                # whole folder is never held at once
+                remaining = iter(paths)
+                pending = deque()
+
+                def submit_next():
+                    path = next(remaining, None)
+                    if path is not None:
+                        pending.append(pool.submit(probe_file, path, self.keep_sound))
+
+                for _ in range(self.workers * PROBE_AHEAD_PER_WORKER):
+                    submit_next()
+                # Results are collected in scan order so tiles keep the folder's order
+                while pending:
+                    if self.cancelled:
+                        pool.shutdown(cancel_futures=True)
+                        break
+                    result = pending.popleft().result()
+                    submit_next()
+                    self.done += 1
+                    if "error" in result:
+                        self.failed.append((result["path"], result["error"]))
+                        continue
+                    batch.append(result)
+                    if len(batch) >= self.batch_size:
+                        self._batches.put(batch)
+                        batch = []
+            if batch and not self.cancelled:
+                self._batches.put(batch)
+        finally:
+            self.finished.set()
@@ -0,0 +1,144 @@
+import json
+import atexit
+import time
+import itertools
+import threading
+from collections import deque
+
+from errors import ReportsErrors
+
+# Event kinds
+TRIGGER = "trigger"
+STOP = "stop"
+VOLUME = "volume"
+
+DEFAULT_CAPACITY = 65536
+# Seconds between bulk writes of the ring buffer to disk
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+JOURNAL_VERSION = 1
+
+
+class EventJournal(ReportsErrors):
+    """Ring buffer of trigger, stop and volume events with monotonic timestamps.
+
+    Recording is a single deque append on the calling thread. When a file is
+    attached, a writer thread drains the ring in bulk every flush interval.
+    If the ring wraps before it is drained, the lost events are counted.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.origin = time.monotonic()
+        self.path = None
+        self.written = 0
+        self.overflowed = 0
+        self._ring = deque(maxlen=capacity)
+        self._sequence = itertools.count()
+        self._next_expected = 0
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, kind, name=None, value=None):
+        self._ring.append((next(self._sequence), time.monotonic(), kind, name, value))
+
+    def events(self):
+        """Returns the events still in the ring as (seconds since start, kind, name, value)."""
+        return [(timestamp - self.origin, kind, name, value) for _, timestamp, kind, name, value in list(self._ring)]
+
+    # Writing to disk
+
+    def start(self, path, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        """Starts writing events to a JSON-lines file, beginning with the ones already in the ring."""
+        with self._write_lock:
+            self.path = path
+            with open(path, "w") as f:
+                f.write(json.dumps({"journal": JOURNAL_VERSION, "started": time.time() - (time.monotonic() - self.origin)}) + "\n")
+            if self._ring:
+                self._next_expected = self._ring[0][0]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(flush_interval,), name="journal-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def flush(self):
+        """Writes every buffered event to the file in one write."""
+        with self._write_lock:
+            if self.path is None:
+                return
+            batch = []
+            while True:
+                try:
+                    batch.append(self._ring.popleft())
+                except IndexError:
+                    break
+            if not batch:
+                return
+            if batch[0][0] > self._next_expected:
+                self.overflowed += batch[0][0] - self._next_expected
+            self._next_expected = batch[-1][0] + 1
+            lines = [json.dumps([round(timestamp - self.origin, 6), kind, name, value]) for _, timestamp, kind, name, value in batch]
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+            self.written += len(batch)
+
+    def close(self):
+        """Stops the writer thread after a final flush."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except OSError as e:
+            self._report_error("Journal Error", f"Could not write event journal: {e}")
+
+    def _run(self, flush_interval):
+        while not self._stop.wait(flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                self._report_error("Journal Error", f"Could not write event journal: {e}")
+
+    def stats(self):
+        return {
+            "buffered": len(self._ring),
+            "capacity": self.capacity,
+            "written": self.written,
+            "overflowed": self.overflowed,
+            "path": self.path,
+        }
+
+
+def load_journal(path):
+    """Reads a journal file into a list of (seconds, kind, name, value) events."""
+    events = []
+    with open(path, "r") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("journal") != JOURNAL_VERSION:
+            raise ValueError(f"'{path}' is not a version {JOURNAL_VERSION} event journal")
+        for line in f:
+            if line.strip():
+                events.append(tuple(json.loads(line)))
+    return events
+
+
+def to_timeline(events):
+    """Converts journal events to a timeline for the offline renderer, starting at zero.
+
+    Files played without a tile name have nothing to render from and are left out.
+    """
+    if not events:
+        return []
+    start = events[0][0]
+    timeline = []
+    for seconds, kind, name, value in events:
+        at = round(seconds - start, 6)
+        if kind == TRIGGER and name is not None:
+            timeline.append({"time": at, "tile": name})
+        elif kind == STOP:
+            timeline.append({"time": at, "stop": True})
+        elif kind == VOLUME:
+            timeline.append({"time": at, "volume": value})
+    return timeline
@@ -0,0 +1,27 @@
+import importlib
+import importlib.util
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    pygame and NumPy take a few hundred milliseconds to import, so the
+    engine modules refer to them through this and the window can appear
+    before either is loaded. Attributes are cached on first use, so later
+    lookups cost the same as on the real module.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        # The import system's per-module lock makes this safe from any thread
+        module = importlib.import_module(self._name)
+        value = getattr(module, attribute)
+        setattr(self, attribute, value)
+        return value
+
+
+def module_available(name):
+    """Returns whether a module can be imported, without importing it."""
+    return importlib.util.find_spec(name) is not None
@@ -0,0 +1,241 @@
+import os
+import json
+import math
+import queue
+import hashlib
+import threading
+
+from errors import ReportsErrors
+from lazy import LazyModule, module_available
+
+pygame = LazyModule("pygame")
+np = LazyModule("numpy")
+# Loudness normalization is skipped without NumPy
+NUMPY_AVAILABLE = module_available("numpy")
+
+
+LOUDNESS_CACHE_FILE = "loudness_cache.json"
+
+# Clips are turned down towards this loudness. pygame channel volumes
+# cannot go above 1.0, so quieter clips are left as they are.
+DEFAULT_TARGET_LUFS = -20.0
+# Never let normalization push a clip's peak above this level
+PEAK_CEILING_DB = -1.0
+
+BLOCK_SECONDS = 0.4
+BLOCK_STEP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+# Long files are K-weighted in pieces of this length to bound FFT memory
+FILTER_CHUNK_SECONDS = 30
+
+
+def db_to_gain(db):
+    return 10 ** (db / 20)
+
+
+def gain_to_db(gain):
+    return 20 * math.log10(gain)
+
+
+def content_hash(file_path):
+    """Returns a hash of the file's bytes, so renamed or copied files share an analysis."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _biquad_response(b, a, frequencies, sample_rate):
+    """Magnitude response of a biquad at the given frequencies."""
+    z = np.exp(-2j * np.pi * frequencies / sample_rate)
+    numerator = b[0] + b[1] * z + b[2] * z ** 2
+    denominator = a[0] + a[1] * z + a[2] * z ** 2
+    return np.abs(numerator / denominator)
+
+
+def k_weighting(frequencies, sample_rate):
+    """Magnitude response of the ITU-R BS.1770 K-weighting filter."""
+    # Stage 1: high shelf, +4 dB above ~1.5 kHz
+    gain_db, q, fc = 4.0, 1 / math.sqrt(2), 1500.0
+    A = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    shelf_b = (
+        A * ((A + 1) + (A - 1) * cos_w0 + 2 * math.sqrt(A) * alpha),
+        -2 * A * ((A - 1) + (A + 1) * cos_w0),
+        A * ((A + 1) + (A - 1) * cos_w0 - 2 * math.sqrt(A) * alpha),
+    )
+    shelf_a = (
+        (A + 1) - (A - 1) * cos_w0 + 2 * math.sqrt(A) * alpha,
+        2 * ((A - 1) - (A + 1) * cos_w0),
+        (A + 1) - (A - 1) * cos_w0 - 2 * math.sqrt(A) * alpha,
+    )
+    # Stage 2: high pass at ~38 Hz
+    q, fc = 0.5, 38.0
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    highpass_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    highpass_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+    return _biquad_response(shelf_b, shelf_a, frequencies, sample_rate) * _biquad_response(highpass_b, highpass_a, frequencies, sample_rate)
+
+
+def sound_samples(sound):
+    """Returns a decoded sound as a float32 (frames, channels) array in [-1, 1]."""
+    samples = pygame.sndarray.array(sound)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    if np.issubdtype(samples.dtype, np.integer):
+        return samples.astype(np.float32) / (np.iinfo(samples.dtype).max + 1)
+    return samples.astype(np.float32)
+
+
+def measure(samples, sample_rate):
+    """Returns RMS, peak and gated, K-weighted loudness (approximate LUFS) of the samples."""
+    peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64)))) if samples.size else 0.0
+
+    # K-weight every channel in the frequency domain, summing the energy over channels
+    energy = np.empty(samples.shape[0], dtype=np.float64)
+    chunk = int(FILTER_CHUNK_SECONDS * sample_rate)
+    for start in range(0, samples.shape[0], chunk):
+        piece = samples[start:start + chunk]
+        response = k_weighting(np.fft.rfftfreq(piece.shape[0], 1 / sample_rate), sample_rate)
+        weighted = np.fft.irfft(np.fft.rfft(piece, axis=0) * response[:, np.newaxis], n=piece.shape[0], axis=0)
+        energy[start:start + chunk] = np.square(weighted, dtype=np.float64).sum(axis=1)
+
+    # Mean square of overlapping 400 ms blocks
+    block = int(BLOCK_SECONDS * sample_rate)
+    step = int(BLOCK_STEP_SECONDS * sample_rate)
+    if energy.size < block:
+        block_power = np.array([energy.mean()]) if energy.size else np.array([0.0])
+    else:
+        cumulative = np.concatenate(([0.0], np.cumsum(energy)))
+        starts = np.arange(0, energy.size - block + 1, step)
+        block_power = (cumulative[starts + block] - cumulative[starts]) / block
+
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+    gated = block_power[block_loudness > ABSOLUTE_GATE_LUFS]
+    if gated.size == 0:
+        lufs = ABSOLUTE_GATE_LUFS
+    else:
+        relative_gate = -0.691 + 10 * math.log10(gated.mean()) + RELATIVE_GATE_LU
+        with np.errstate(divide="ignore"):
+            gated = gated[-0.691 + 10 * np.log10(gated) > relative_gate]
+        lufs = -0.691 + 10 * math.log10(gated.mean()) if gated.size else ABSOLUTE_GATE_LUFS
+
+    def to_db(value):
+        return 20 * math.log10(value) if value > 0 else -math.inf
+
+    return {"lufs": lufs, "rms_db": to_db(rms), "peak_db": to_db(peak)}
+
+
+def normalization_gain(analysis, target_lufs=DEFAULT_TARGET_LUFS):
+    """Returns the channel volume (0..1) that brings a clip towards the target loudness."""
+    gain_db = target_lufs - analysis["lufs"]
+    gain_db = min(gain_db, PEAK_CEILING_DB - analysis["peak_db"], 0.0)
+    return db_to_gain(gain_db)
+
+
+class LoudnessAnalyzer(ReportsErrors):
+    """Measures clip loudness in the background and caches the results on disk by content hash.
+
+    At trigger time the gain is a dict lookup; nothing is analyzed on the
+    playback path.
+    """
+
+    def __init__(self, data_dir, sample_cache, target_lufs=DEFAULT_TARGET_LUFS):
+        self.available = NUMPY_AVAILABLE
+        self.path = os.path.join(data_dir, LOUDNESS_CACHE_FILE)
+        self.sample_cache = sample_cache
+        self.target_lufs = target_lufs
+        self.gains = {}  # file path -> channel volume
+        self.analyzed = 0
+        self._cache = self._load()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable loudness cache: {e}")
+        return {"analyses": {}, "files": {}}
+
+    def _save(self):
+        with self._lock:
+            document = json.dumps(self._cache)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(document)
+        os.replace(temp_path, self.path)
+
+    def gain_for(self, file_path):
+        """Returns the normalization gain for a file, or 1.0 until it has been analyzed."""
+        return self.gains.get(file_path, 1.0)
+
+    def analyze(self, file_paths, keep=True):
+        """Queues files for analysis on the background thread. With keep=False, decoded audio bypasses the sample cache."""
+        if not self.available:
+            return
+        for path in file_paths:
+            if path:
+                self._queue.put((path, keep))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="loudness-analysis", daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Blocks until every queued file has been analyzed."""
+        self._queue.join()
+
+    def ensure(self, file_path, keep=True):
+        """Analyzes a file on the calling thread unless it already has a gain, and returns the gain."""
+        if self.available and file_path not in self.gains:
+            self.gains[file_path] = normalization_gain(self.analysis_for(file_path, keep), self.target_lufs)
+        return self.gain_for(file_path)
+
+    def analysis_for(self, file_path, keep=True):
+        """Returns the cached analysis for a file, measuring it if needed."""
+        stat = os.stat(file_path)
+        known = self._cache["files"].get(os.path.abspath(file_path))
+        if known is not None and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+            digest = known["hash"]
+        else:
+            digest = content_hash(file_path)
+            with self._lock:
+                self._cache["files"][os.path.abspath(file_path)] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest}
+        analysis = self._cache["analyses"].get(digest)
+        if analysis is None:
+            sound = self.sample_cache.load(file_path) if keep else pygame.mixer.Sound(file_path)
+            analysis = measure(sound_samples(sound), pygame.mixer.get_init()[0])
+            with self._lock:
+                self._cache["analyses"][digest] = analysis
+            self.analyzed += 1
+        return analysis
+
+    def _run(self):
+        dirty = False
+        while True:
+            path, keep = self._queue.get()
+            try:
+                analysis = self.analysis_for(path, keep)
+                self.gains[path] = normalization_gain(analysis, self.target_lufs)
+                dirty = True
+            except (OSError, ValueError, pygame.error) as e:
+                self._report_error("Analysis Error", f"Could not analyze '{os.path.basename(path)}': {e}")
+            finally:
+                self._queue.task_done()
+            if dirty and self._queue.empty():
+                try:
+                    self._save()
+                except OSError as e:
+                    self._report_error("Save Error", f"Could not save loudness cache: {e}")
+                dirty = False
@@ -0,0 +1,192 @@
+import os
+import json
+import socket
+import threading
+from collections import deque
+
+# Recent durations kept per timer for the percentiles
+TIMER_SAMPLES = 1000
+# Percentiles reported by summarize()
+QUANTILES = (0.50, 0.95, 0.99)
+
+# Snapshot formats for MetricsExporter
+JSON = "json"
+PROMETHEUS = "prometheus"
+FORMATS = (JSON, PROMETHEUS)
+DEFAULT_EXPORT_INTERVAL = 5.0
+PROMETHEUS_PREFIX = "soundboard"
+
+
+class Metrics:
+    """Timers and counters for the hot paths, cheap enough to leave on during a show.
+
+    Recording is a lock and a deque append; percentiles are only worked out
+    when a snapshot is taken.
+    """
+
+    def __init__(self, samples=TIMER_SAMPLES):
+        self.samples = samples
+        self.timers = {}       # name -> recent durations in seconds
+        self.timer_counts = {}  # name -> observations ever
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            durations = self.timers.get(name)
+            if durations is None:
+                durations = self.timers[name] = deque(maxlen=self.samples)
+                self.timer_counts[name] = 0
+            durations.append(seconds)
+            self.timer_counts[name] += 1
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Returns {"timers": {name: summary in ms}, "counters": {name: value}}."""
+        with self._lock:
+            timers = {name: (list(durations), self.timer_counts[name]) for name, durations in self.timers.items()}
+            counters = dict(self.counters)
+        return {
+            "timers": {name: dict(summarize(durations), count=count) for name, (durations, count) in timers.items()},
+            "counters": counters,
+        }
+
+
+def summarize(durations, quantiles=QUANTILES):
+    """Returns the count and mean, percentiles and max in milliseconds of durations in seconds.
+
+    Used for the live timers, hotkey latency, benchmarks and replay reports.
+    """
+    samples = sorted(durations)
+    if not samples:
+        return {"count": 0}
+    summary = {"count": len(samples), "mean_ms": sum(samples) / len(samples) * 1000}
+    for quantile in quantiles:
+        summary[f"p{round(quantile * 100)}_ms"] = samples[min(len(samples) - 1, int(quantile * len(samples)))] * 1000
+    summary["max_ms"] = samples[-1] * 1000
+    return summary
+
+
+def to_prometheus(document, prefix=PROMETHEUS_PREFIX):
+    """Renders a stats document in the Prometheus text format.
+
+    Timers become summaries in seconds and counters become totals. Every
+    other number in the document becomes a gauge named after its path.
+    """
+    lines = []
+    metrics = document.get("metrics", {})
+    for name, summary in sorted(metrics.get("timers", {}).items()):
+        metric = f"{prefix}_{name}_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for quantile in ("0.5", "0.95", "0.99"):
+            key = f"p{round(float(quantile) * 100)}_ms"
+            if key in summary:
+                lines.append(f'{metric}{{quantile="{quantile}"}} {summary[key] / 1000:.9f}')
+        lines.append(f"{metric}_count {summary['count']}")
+    for name, value in sorted(metrics.get("counters", {}).items()):
+        lines.append(f"# TYPE {prefix}_{name}_total counter")
+        lines.append(f"{prefix}_{name}_total {value}")
+
+    def gauges(section, path):
+        for key, value in section.items():
+            name = f"{path}_{key}"
+            if isinstance(value, dict):
+                gauges(value, name)
+            elif isinstance(value, (bool, int)):
+                # Counts and byte sizes are exported exactly
+                lines.append(f"{name} {int(value)}")
+            elif isinstance(value, float):
+                lines.append(f"{name} {value!r}")
+
+    gauges({key: value for key, value in document.items() if key != "metrics"}, prefix)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """Writes a stats snapshot every `interval` seconds to a file and/or a TCP listener.
+
+    The file is replaced atomically, so a scraper (e.g. node_exporter's
+    textfile collector for the Prometheus format) never reads half of one.
+    On the socket, each JSON snapshot is one line; Prometheus snapshots are
+    followed by a blank line.
+    """
+
+    def __init__(self, collect, path=None, address=None, interval=DEFAULT_EXPORT_INTERVAL, format=JSON):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown metrics format '{format}'")
+        self.collect = collect
+        self.path = path
+        self.address = address
+        self.interval = interval
+        self.format = format
+        self.exports = 0
+        self.failures = 0
+        self._failing = False
+        self._socket = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def render(self):
+        document = self.collect()
+        if self.format == PROMETHEUS:
+            return to_prometheus(document)
+        return json.dumps(document) + "\n"
+
+    def export_once(self):
+        text = self.render()
+        if self.path:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                f.write(text)
+            os.replace(temp_path, self.path)
+        if self.address:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address, timeout=1.0)
+            try:
+                self._socket.sendall((text + "\n" if self.format == PROMETHEUS else text).encode("utf-8"))
+            except OSError:
+                # Reconnect on the next export
+                self._socket.close()
+                self._socket = None
+                raise
+        self.exports += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.export_once()
+            except OSError as e:
+                # Only the first failure in a row is printed, so a missing listener doesn't flood the console
+                if not self._failing:
+                    print(f"Could not export metrics: {e}")
+                self._failing = True
+                self.failures += 1
+            else:
+                self._failing = False
+
+
+def parse_address(text):
+    """Parses "host:port" (or just "port" for localhost) into a socket address."""
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+# Shared by the engine, its caches and the UI
+METRICS = Metrics()
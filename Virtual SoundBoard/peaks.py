@@ -0,0 +1,214 @@
+import os
+import json
+import zlib
+import queue
+import base64
+import struct
+import threading
+
+from errors import ReportsErrors
+from loudness import content_hash, sound_samples
+from lazy import LazyModule, module_available
+
+pygame = LazyModule("pygame")
+np = LazyModule("numpy")
+# Waveforms are not drawn without NumPy
+NUMPY_AVAILABLE = module_available("numpy")
+
+
+PEAKS_FILE = "peaks.bin"
+PEAKS_INDEX_FILE = "peaks_index.json"
+
+# Number of min/max pairs stored per file, one entry per zoom level
+PEAK_LEVELS = (32, 128, 512)
+
+
+def compute_peaks(samples, levels=PEAK_LEVELS):
+    """Returns int8 (bins, 2) min/max arrays of the samples at each zoom level."""
+    low = samples.min(axis=1) if samples.size else np.zeros(1, dtype=np.float32)
+    high = samples.max(axis=1) if samples.size else np.zeros(1, dtype=np.float32)
+    result = []
+    for bins in levels:
+        edges = np.arange(bins) * len(low) // bins
+        pairs = np.stack((np.minimum.reduceat(low, edges), np.maximum.reduceat(high, edges)), axis=1)
+        result.append(np.clip(np.round(pairs * 127), -127, 127).astype(np.int8))
+    return result
+
+
+def resample_peaks(levels, width):
+    """Reduces the closest stored zoom level to exactly `width` min/max pairs."""
+    peaks = next((level for level in levels if len(level) >= width), levels[-1])
+    edges = np.arange(width) * len(peaks) // width
+    return np.stack((np.minimum.reduceat(peaks[:, 0], edges), np.maximum.reduceat(peaks[:, 1], edges)), axis=1)
+
+
+def waveform_png(levels, width, height, color):
+    """Draws peaks as a PNG with a transparent background and returns it base64-encoded for Tk."""
+    peaks = resample_peaks(levels, width).astype(np.float32) / 127
+    middle = (height - 1) / 2
+    top = np.round(middle - peaks[:, 1] * middle)
+    bottom = np.round(middle - peaks[:, 0] * middle)
+    rows = np.arange(height)[:, np.newaxis]
+    mask = (rows >= top) & (rows <= bottom)
+
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    pixels[mask] = (*color, 255)
+    # Each PNG scanline starts with a filter-type byte (0: none)
+    raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 4)), axis=1)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    png = (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 1))
+        + chunk(b"IEND", b"")
+    )
+    return base64.b64encode(png)
+
+
+class PeakCache(ReportsErrors):
+    """Builds waveform peaks in the background and serves them from a memory-mapped file.
+
+    Peaks for every file live in one append-only peaks.bin, located through
+    peaks_index.json by content hash. Drawing a tile only touches the pages of
+    the map it needs; audio is decoded once per file, ever.
+    """
+
+    def __init__(self, data_dir, sample_cache, levels=PEAK_LEVELS):
+        self.available = NUMPY_AVAILABLE
+        self.path = os.path.join(data_dir, PEAKS_FILE)
+        self.index_path = os.path.join(data_dir, PEAKS_INDEX_FILE)
+        self.sample_cache = sample_cache
+        self.levels = tuple(levels)
+        self.on_ready = None
+        self.computed = 0
+        # peaks_for() answers None until open() has mapped the file
+        self.opened = False
+        self._index = self._load_index()
+        self._map = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    index = json.load(f)
+                # Drop entries that point past the end of the peaks file, e.g. after a crash
+                size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                index["peaks"] = {
+                    digest: entry for digest, entry in index["peaks"].items()
+                    if entry["offset"] + sum(entry["levels"]) * 2 <= size
+                }
+                return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable peaks index: {e}")
+        return {"files": {}, "peaks": {}}
+
+    def _save_index(self):
+        with self._lock:
+            document = json.dumps(self._index)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(document)
+        os.replace(temp_path, self.index_path)
+
+    def _entry_for(self, file_path):
+        """Returns the index entry for a file's peaks without reading the file, or None."""
+        stat = os.stat(file_path)
+        known = self._index["files"].get(os.path.abspath(file_path))
+        if known is None or known["mtime_ns"] != stat.st_mtime_ns or known["size"] != stat.st_size:
+            return None
+        return self._index["peaks"].get(known["hash"])
+
+    def open(self):
+        """Maps the peaks file. This imports NumPy, so it is meant to run off the UI thread."""
+        if self.available:
+            with self._lock:
+                # An empty file can't be mapped; peaks_for() maps it once peaks are built
+                if self._map is None and os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                    self._map = np.memmap(self.path, dtype=np.int8, mode="r")
+        self.opened = True
+
+    def peaks_for(self, file_path):
+        """Returns the stored zoom levels for a file, or None if they are not built or opened yet. Never decodes."""
+        if not self.available or not self.opened:
+            return None
+        try:
+            entry = self._entry_for(file_path)
+        except OSError:
+            return None
+        if entry is None:
+            return None
+        end = entry["offset"] + sum(entry["levels"]) * 2
+        with self._lock:
+            if self._map is None or len(self._map) < end:
+                # The file has grown since it was mapped
+                self._map = np.memmap(self.path, dtype=np.int8, mode="r")
+            data = self._map
+        levels = []
+        offset = entry["offset"]
+        for bins in entry["levels"]:
+            levels.append(data[offset:offset + bins * 2].reshape(bins, 2))
+            offset += bins * 2
+        return levels
+
+    def request(self, file_paths, keep=True):
+        """Queues files for peak building. With keep=False, decoded audio bypasses the sample cache."""
+        if not self.available:
+            return
+        for path in file_paths:
+            if path:
+                self._queue.put((path, keep))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="peak-builder", daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Blocks until every queued file has peaks."""
+        self._queue.join()
+
+    def build(self, file_path, keep=True):
+        """Computes and stores peaks for a file unless they are already on disk."""
+        if self._entry_for(file_path) is not None:
+            return False
+        stat = os.stat(file_path)
+        digest = content_hash(file_path)
+        with self._lock:
+            self._index["files"][os.path.abspath(file_path)] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": digest}
+        if digest in self._index["peaks"]:
+            # Same audio under another path
+            return True
+        sound = self.sample_cache.load(file_path) if keep else pygame.mixer.Sound(file_path)
+        levels = compute_peaks(sound_samples(sound), self.levels)
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            for level in levels:
+                f.write(level.tobytes())
+        with self._lock:
+            self._index["peaks"][digest] = {"offset": offset, "levels": [len(level) for level in levels]}
+        self.computed += 1
+        return True
+
+    def _run(self):
+        dirty = False
+        while True:
+            path, keep = self._queue.get()
+            try:
+                if self.build(path, keep):
+                    dirty = True
+                    if self.on_ready is not None:
+                        self.on_ready(path)
+            except (OSError, ValueError, pygame.error) as e:
+                self._report_error("Waveform Error", f"Could not build waveform for '{os.path.basename(path)}': {e}")
+            finally:
+                self._queue.task_done()
+            if dirty and self._queue.empty():
+                try:
+                    self._save_index()
+                except OSError as e:
+                    self._report_error("Save Error", f"Could not save peaks index: {e}")
+                dirty = False
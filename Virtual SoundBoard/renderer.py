@@ -0,0 +1,213 @@
+"""Offline renderer: mixes a timeline of tile triggers into a WAV file.
+
+Needs no display or audio device, and runs far faster than real time.
+A timeline is a JSON list of events, each at a time in seconds:
+
+    [{"time": 0.0, "tile": "ara-ara"},
+     {"time": 1.25, "tile": "defuse-valorant", "gain": 0.5},
+     {"time": 2.0, "volume": 0.8},
+     {"time": 4.0, "stop": true}]
+
+"[time, tile, gain]" triples are accepted for triggers as well.
+
+    python renderer.py timeline.json session.wav --data-dir .
+"""
+import os
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import time
+import wave
+
+import numpy as np
+import pygame
+
+from effects import apply_effects, effects_key, STREAM_EFFECTS
+from loudness import sound_samples
+from store import DEFAULT_BOARD
+from streaming import STREAM
+from voice_engine import OVERLAP, RETRIGGER, CHOKE, STEAL_QUIETEST, STEAL_LOWEST_PRIORITY, DEFAULT_MAX_VOICES, STEAL_OLDEST, STEAL_POLICIES
+
+# pygame has one music stream, so every streamed tile shares this voice key
+STREAM_KEY = object()
+
+
+class RenderedVoice:
+    """A source placed on the output timeline, in frames."""
+
+    def __init__(self, samples, key, gain, priority, choke_group, start):
+        self.samples = samples
+        self.key = key
+        self.gain = gain
+        self.priority = priority
+        self.choke_group = choke_group
+        self.start = start
+        self.end = start + len(samples)
+
+
+def parse_timeline(events):
+    """Normalizes timeline entries to dicts sorted by time (stable for equal times)."""
+    parsed = []
+    for event in events:
+        if isinstance(event, (list, tuple)):
+            time_, tile, *rest = event
+            event = {"time": time_, "tile": tile, "gain": rest[0] if rest else 1.0}
+        if "time" not in event or not any(key in event for key in ("tile", "stop", "volume")):
+            raise ValueError(f"Timeline event needs a time and a tile, stop or volume: {event}")
+        parsed.append(event)
+    return sorted(parsed, key=lambda event: float(event["time"]))
+
+
+class OfflineRenderer:
+    """Mixes triggers sample-accurately with the engine's gain, trigger policy and voice limits.
+
+    Sources are decoded once at the mixer's rate, so the output matches what
+    the live mixer would play.
+    """
+
+    def __init__(self, engine, master_volume=1.0):
+        self.engine = engine
+        self.master_volume = master_volume
+        frequency, _, channels = pygame.mixer.get_init()
+        self.sample_rate = frequency
+        self.channels = channels
+        self._sources = {}  # (path, effects key) -> float32 samples
+
+    def source(self, file_path, effects=None):
+        """Returns a file's samples with a tile's effects applied, decoding and rendering each variant once."""
+        key = (file_path, effects_key(effects or {}))
+        if key not in self._sources:
+            if effects:
+                samples = apply_effects(self.source(file_path), self.sample_rate, effects)
+            else:
+                samples = sound_samples(self.engine.sample_cache.load(file_path))
+            self._sources[key] = samples
+        return self._sources[key]
+
+    def schedule(self, events):
+        """Turns a timeline into voices with their cut-off points, plus master volume changes."""
+        voices = []
+        active = []
+        volume_changes = [(0, self.master_volume)]
+        max_voices = self.engine.voice_engine.max_voices
+        steal_policy = self.engine.voice_engine.steal_policy
+
+        def stop(voice, frame):
+            voice.end = min(voice.end, frame)
+            active.remove(voice)
+
+        for event in parse_timeline(events):
+            frame = round(float(event["time"]) * self.sample_rate)
+            for voice in [voice for voice in active if voice.end <= frame]:
+                active.remove(voice)
+            if event.get("stop"):
+                for voice in list(active):
+                    stop(voice, frame)
+                continue
+            if "volume" in event:
+                volume_changes.append((frame, float(event["volume"])))
+                continue
+
+            name = event["tile"]
+            path = self.engine.sounds.get(name)
+            if not path:
+                print(f"Skipping unknown tile '{name}' at {event['time']}s")
+                continue
+            settings = self.engine.tile_settings.get(name, {})
+            streamed = self.engine.playback_mode(name, path) == STREAM
+            # Live playback uses the gain once background analysis is done
+            self.engine.loudness.ensure(path)
+            gain = min(self.engine.tile_gain(path, name) * float(event.get("gain", 1.0)), 1.0)
+            effects = settings.get("effects", {})
+            if streamed:
+                effects = {effect: value for effect, value in effects.items() if effect in STREAM_EFFECTS}
+
+            if streamed:
+                key, policy, choke_group = STREAM_KEY, RETRIGGER, None
+            else:
+                key, policy, choke_group = path, settings.get("policy", OVERLAP), settings.get("choke_group")
+            if policy == RETRIGGER:
+                for voice in [voice for voice in active if voice.key == key]:
+                    stop(voice, frame)
+            elif policy == CHOKE and choke_group is not None:
+                for voice in [voice for voice in active if voice.choke_group == choke_group]:
+                    stop(voice, frame)
+            if key is not STREAM_KEY and sum(voice.key is not STREAM_KEY for voice in active) >= max_voices:
+                channel_voices = [voice for voice in active if voice.key is not STREAM_KEY]
+                if steal_policy == STEAL_QUIETEST:
+                    victim = min(channel_voices, key=lambda voice: (voice.gain, voice.start))
+                elif steal_policy == STEAL_LOWEST_PRIORITY:
+                    victim = min(channel_voices, key=lambda voice: (voice.priority, voice.start))
+                else:
+                    victim = min(channel_voices, key=lambda voice: voice.start)
+                stop(victim, frame)
+
+            voice = RenderedVoice(self.source(path, effects), key, gain, settings.get("priority", 0), choke_group, frame)
+            voices.append(voice)
+            active.append(voice)
+        return voices, volume_changes
+
+    def render(self, events, duration=None):
+        """Returns the mix of a timeline as a float32 (frames, channels) array."""
+        voices, volume_changes = self.schedule(events)
+        if duration is not None:
+            total = round(duration * self.sample_rate)
+        else:
+            total = max((voice.end for voice in voices), default=0)
+        mix = np.zeros((total, self.channels), dtype=np.float32)
+        for voice in voices:
+            end = min(voice.end, total)
+            if end > voice.start:
+                mix[voice.start:end] += voice.samples[:end - voice.start] * voice.gain
+
+        # Master volume scales every voice from the moment it changes
+        for (start, volume), (stop, _) in zip(volume_changes, volume_changes[1:] + [(total, None)]):
+            mix[start:stop] *= volume
+        return np.clip(mix, -1.0, 1.0)
+
+    def write_wav(self, mix, output_path):
+        pcm = np.round(mix * 32767).astype("<i2")
+        with wave.open(output_path, "wb") as f:
+            f.setnchannels(self.channels)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(pcm.tobytes())
+
+
+def render_file(engine, timeline_path, output_path, master_volume=1.0, duration=None):
+    """Renders a timeline file to a WAV file and returns (seconds rendered, seconds taken)."""
+    with open(timeline_path, "r") as f:
+        events = json.load(f)
+    start = time.perf_counter()
+    renderer = OfflineRenderer(engine, master_volume)
+    mix = renderer.render(events, duration)
+    renderer.write_wav(mix, output_path)
+    return len(mix) / renderer.sample_rate, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mix a timeline of soundboard triggers into a WAV file.")
+    parser.add_argument("timeline", help="JSON list of trigger, stop and volume events")
+    parser.add_argument("output", help="WAV file to write")
+    parser.add_argument("--data-dir", default=".", help="folder holding the soundboard's saved board")
+    parser.add_argument("--board", default=DEFAULT_BOARD, help="board whose tiles the timeline refers to")
+    parser.add_argument("--max-voices", type=int, default=DEFAULT_MAX_VOICES, help="sounds that can play at once")
+    parser.add_argument("--steal-policy", choices=STEAL_POLICIES, default=STEAL_OLDEST, help="which sound to cut when every voice is busy")
+    parser.add_argument("--volume", type=float, default=1.0, help="master volume at the start")
+    parser.add_argument("--duration", type=float, help="length in seconds (default: until the last sound ends)")
+    parser.add_argument("--frequency", type=int, default=44100)
+    parser.add_argument("--channels", type=int, default=2)
+    args = parser.parse_args()
+
+    pygame.mixer.init(frequency=args.frequency, channels=args.channels)
+    from engine import SoundBoardEngine
+
+    engine = SoundBoardEngine(args.data_dir, board=args.board, max_voices=args.max_voices, steal_policy=args.steal_policy)
+    try:
+        rendered, taken = render_file(engine, args.timeline, args.output, args.volume, args.duration)
+    finally:
+        engine.close()
+    print(f"Rendered {rendered:.2f}s of audio to {args.output} in {taken:.2f}s ({rendered / max(taken, 1e-9):.0f}x real time)")
@@ -0,0 +1,124 @@
+"""Replays a recorded event journal through the engine's playback path.
+
+Record a session with `python Soundboard.py --record show.jsonl` (or the
+same flag on trigger_server.py), then feed it back at 1x or faster:
+
+    python replay.py show.jsonl --data-dir . --speed 4
+    python replay.py show.jsonl --export-timeline show.json
+
+Reports dropped and late triggers and latency percentiles as JSON.
+"""
+import os
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import time
+
+import pygame
+
+from journal import load_journal, to_timeline, TRIGGER, STOP, VOLUME
+from metrics import summarize
+from store import DEFAULT_BOARD
+from voice_engine import DEFAULT_MAX_VOICES, STEAL_OLDEST, STEAL_POLICIES
+
+# A trigger that reaches the mixer this long after it was due counts as late
+LATE_THRESHOLD_MS = 5.0
+# Sleep until this close to an event, then spin for accuracy
+SPIN_SECONDS = 0.002
+
+
+def replay(engine, events, speed=1.0, late_ms=LATE_THRESHOLD_MS):
+    """Plays journal events into the engine on their original schedule divided by `speed`."""
+    if not events:
+        return {"events": 0}
+    first = events[0][0]
+    lag, latency = [], []
+    triggers = dropped = late = 0
+    origin = time.perf_counter()
+    for seconds, kind, name, value in events:
+        due = origin + (seconds - first) / speed
+        remaining = due - time.perf_counter()
+        if remaining > SPIN_SECONDS:
+            time.sleep(remaining - SPIN_SECONDS)
+        while time.perf_counter() < due:
+            pass
+
+        began = time.perf_counter()
+        if kind == TRIGGER:
+            if name in engine.sounds:
+                played = engine.trigger(name)
+            else:
+                played = bool(value) and engine.play_file(value, name)
+        elif kind == STOP:
+            engine.stop_all()
+        elif kind == VOLUME:
+            engine.set_volume(value)
+        ended = time.perf_counter()
+
+        if kind == TRIGGER:
+            triggers += 1
+            lag.append(began - due)
+            latency.append(ended - began)
+            if not played:
+                dropped += 1
+            elif (ended - due) * 1000 > late_ms:
+                late += 1
+
+    result = {
+        "events": len(events),
+        "triggers": triggers,
+        "dropped": dropped,
+        "late": late,
+        "late_threshold_ms": late_ms,
+        "speed": speed,
+        "recorded_seconds": events[-1][0] - first,
+        "wall_seconds": time.perf_counter() - origin,
+        "voices": engine.voice_engine.stats(),
+    }
+    if triggers:
+        result["schedule_lag"] = summarize(lag)
+        result["trigger_latency"] = summarize(latency)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded soundboard session for load testing.")
+    parser.add_argument("journal", help="journal file written with --record")
+    parser.add_argument("--data-dir", default=".", help="folder holding the soundboard's saved board")
+    parser.add_argument("--board", default=DEFAULT_BOARD, help="board the session was recorded on")
+    parser.add_argument("--max-voices", type=int, default=DEFAULT_MAX_VOICES, help="sounds that can play at once")
+    parser.add_argument("--steal-policy", choices=STEAL_POLICIES, default=STEAL_OLDEST, help="which sound to cut when every voice is busy")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, e.g. 4 for four times faster")
+    parser.add_argument("--late-ms", type=float, default=LATE_THRESHOLD_MS, help="how late a trigger may be before it counts as late")
+    parser.add_argument("--cold", action="store_true", help="don't wait for sounds to be preloaded and analyzed first")
+    parser.add_argument("--export-timeline", metavar="TIMELINE", help="write a renderer.py timeline instead of replaying")
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    args = parser.parse_args()
+
+    events = load_journal(args.journal)
+    if args.export_timeline:
+        with open(args.export_timeline, "w") as f:
+            json.dump(to_timeline(events), f, indent=2)
+        raise SystemExit(0)
+
+    pygame.mixer.init()
+    from engine import SoundBoardEngine
+
+    engine = SoundBoardEngine(args.data_dir, board=args.board, max_voices=args.max_voices, steal_policy=args.steal_policy)
+    if not args.cold:
+        # Background analysis competes for the CPU, so let it finish first
+        engine.preload().join()
+        engine.loudness.wait()
+        engine.peaks.wait()
+    try:
+        report = replay(engine, events, args.speed, args.late_ms)
+    finally:
+        engine.stop_all()
+        engine.close()
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,179 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from errors import ReportsErrors
+from lazy import LazyModule
+from metrics import METRICS
+
+pygame = LazyModule("pygame")
+
+
+# Default memory budget for decoded samples (64 MB of PCM)
+DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+
+
+class BudgetedCache:
+    """Least-recently-used cache of sounds within a byte budget, shared by the sample and variant caches.
+
+    Entries are stored with the file key (path, mtime, size) of the file
+    they came from, so a file changed on disk is a miss rather than stale
+    audio.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # entry key -> (file key, sound, size), oldest first
+        self._entries = OrderedDict()
+        # Paths the cache may keep, or None for any; see retain()
+        self._scope = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def sound_size(sound):
+        """Returns the number of bytes of PCM held by a decoded sound."""
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency) * channels * (abs(sample_format) // 8)
+
+    @staticmethod
+    def path_of(entry_key):
+        """Returns the source path an entry key belongs to."""
+        return entry_key
+
+    def _lookup(self, entry_key, file_key, count=True):
+        """Returns the cached sound for a key if it is still current, else None.
+
+        With count=True it also records a hit or miss and marks the entry as recently used.
+        """
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] == file_key:
+                if count:
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                return entry[1]
+            if count:
+                self.misses += 1
+        return None
+
+    def _store(self, entry_key, file_key, sound):
+        size = self.sound_size(sound)
+        with self._lock:
+            self._drop(entry_key)
+            if size > self.budget_bytes or (self._scope is not None and self.path_of(entry_key) not in self._scope):
+                # Too big or out of scope to keep; the caller still gets the sound
+                return
+            self._entries[entry_key] = (file_key, sound, size)
+            self.used_bytes += size
+            while self.used_bytes > self.budget_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.used_bytes -= evicted_size
+                self.evictions += 1
+
+    def _drop(self, entry_key):
+        with self._lock:
+            entry = self._entries.pop(entry_key, None)
+            if entry is not None:
+                self.used_bytes -= entry[2]
+
+    def retain(self, file_paths):
+        """Limits the cache to entries of these files, e.g. the sounds of the open board, and drops the rest.
+
+        Sounds of other files are still returned, but no longer kept, so a
+        warm-up still running for a closed board can't refill the cache.
+        """
+        keep = {os.path.abspath(path) for path in file_paths if path}
+        with self._lock:
+            self._scope = keep
+            for entry_key in [entry_key for entry_key in self._entries if self.path_of(entry_key) not in keep]:
+                self._drop(entry_key)
+
+    def admit(self, file_paths):
+        """Adds files to the set retain() limited the cache to."""
+        with self._lock:
+            if self._scope is not None:
+                self._scope.update(os.path.abspath(path) for path in file_paths if path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def stats(self):
+        """Returns the cache counters as a dict."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "used_bytes": self.used_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SampleCache(BudgetedCache, ReportsErrors):
+    """Keeps decoded sounds in memory so a repeat trigger is just a buffer hand-off to the mixer."""
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        super().__init__(budget_bytes)
+
+    @staticmethod
+    def make_key(file_path):
+        """Returns the cache key for a file: absolute path plus mtime and size."""
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, file_path):
+        """Returns the decoded sound for a file, decoding it on a miss."""
+        key = self.make_key(file_path)
+        sound = self._lookup(key[0], key)
+        if sound is None:
+            sound = self.decode(file_path)
+            self._store(key[0], key, sound)
+        return sound
+
+    def load(self, file_path):
+        """Decodes a file into the cache without counting a hit or miss."""
+        key = self.make_key(file_path)
+        sound = self._lookup(key[0], key, count=False)
+        if sound is None:
+            sound = self.decode(file_path)
+            self._store(key[0], key, sound)
+        return sound
+
+    @staticmethod
+    def decode(file_path):
+        start = time.perf_counter()
+        sound = pygame.mixer.Sound(file_path)
+        METRICS.observe("decode", time.perf_counter() - start)
+        return sound
+
+    def put(self, file_path, sound):
+        """Stores a sound that was decoded elsewhere, e.g. while importing."""
+        key = self.make_key(file_path)
+        self._store(key[0], key, sound)
+
+    def preload(self, file_paths):
+        """Decodes files on a background thread and returns the thread."""
+        paths = [path for path in file_paths if path]
+
+        def worker():
+            for path in paths:
+                try:
+                    self.load(path)
+                except (pygame.error, OSError) as e:
+                    self._report_error("Preload Error", f"Could not preload '{os.path.basename(path)}': {e}")
+
+        thread = threading.Thread(target=worker, name="sample-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def invalidate(self, file_path):
+        """Drops a file from the cache."""
+        self._drop(os.path.abspath(file_path))
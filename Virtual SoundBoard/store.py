@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+STORE_FILE = "soundboard.json"
+STORE_VERSION = 1
+
+# The first board lives in STORE_FILE; every other board in BOARDS_DIR/<name>.json
+DEFAULT_BOARD = "Default"
+BOARDS_DIR = "boards"
+INVALID_BOARD_CHARACTERS = '\\/:*?"<>|'
+
+# Window state from the last session, so the first frame is drawn at its final size
+LAYOUT_FILE = "layout.json"
+
+# Files written by earlier versions, migrated into the store on first run
+LEGACY_FILES = {
+    "sounds": "sounds.json",
+    "key_bindings": "key_bindings.json",
+    "tile_settings": "tile_settings.json",
+}
+
+# Writes happen this long after the last change, but never later than
+# MAX_FLUSH_DELAY after the first unsaved change
+FLUSH_DELAY = 0.5
+MAX_FLUSH_DELAY = 2.0
+
+
+class BoardStore:
+    """Saves each board's sounds, key bindings and tile settings together in one JSON file.
+
+    Changes are only marked dirty on the calling thread. A background writer
+    coalesces them and replaces the file atomically, so a crash mid-write
+    leaves the previous version intact and sounds and bindings never
+    disagree with each other on disk. Only the open board is ever read;
+    the others are known by their file names alone.
+    """
+
+    def __init__(self, data_dir=".", flush_delay=FLUSH_DELAY, on_error=None):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, STORE_FILE)
+        self.boards_dir = os.path.join(data_dir, BOARDS_DIR)
+        self.layout_path = os.path.join(data_dir, LAYOUT_FILE)
+        self.flush_delay = flush_delay
+        self.on_error = on_error
+        self.snapshot = None
+        self.marks = 0
+        self.flushes = 0
+        self._dirty_since = None
+        self._last_mark = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def load(self, board=DEFAULT_BOARD):
+        """Returns a board's stored sections, migrating the legacy JSON files into the default board if needed."""
+        path = self.board_path(board)
+        if board == DEFAULT_BOARD and not os.path.exists(path):
+            data = self.load_legacy()
+            if any(data.values()):
+                self.write(data)
+        else:
+            with open(path, "r") as f:
+                data = json.load(f)
+        return {section: data.get(section, {}) for section in LEGACY_FILES}
+
+    def load_legacy(self):
+        data = {}
+        for section, filename in LEGACY_FILES.items():
+            path = os.path.join(self.data_dir, filename)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    data[section] = json.load(f)
+            else:
+                data[section] = {}
+        return data
+
+    def load_layout(self):
+        """Returns the window layout saved by the last session, or {} if there is none."""
+        try:
+            with open(self.layout_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable layout: {e}")
+            return {}
+
+    def save_layout(self, layout):
+        """Atomically replaces the saved window layout."""
+        temp_path = self.layout_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(layout, f)
+        os.replace(temp_path, self.layout_path)
+
+    # Boards
+
+    def board_path(self, board):
+        if board == DEFAULT_BOARD:
+            return self.path
+        return os.path.join(self.boards_dir, board + ".json")
+
+    def boards(self):
+        """Returns the names of all boards, from the file names alone."""
+        names = [DEFAULT_BOARD]
+        if os.path.isdir(self.boards_dir):
+            names.extend(sorted(
+                os.path.splitext(filename)[0] for filename in os.listdir(self.boards_dir)
+                if filename.endswith(".json")
+            ))
+        return names
+
+    def create_board(self, board):
+        """Saves a new, empty board; raises ValueError if the name is unusable or taken."""
+        # A leading dot would make "." and ".." paths, or hidden files boards() can't name
+        if not board.strip() or board.startswith(".") or any(character in INVALID_BOARD_CHARACTERS for character in board):
+            raise ValueError(f"'{board}' can't be used as a board name")
+        if board in self.boards():
+            raise ValueError(f"There is already a board named '{board}'")
+        os.makedirs(self.boards_dir, exist_ok=True)
+        self.write({section: {} for section in LEGACY_FILES}, board)
+
+    def delete_board(self, board):
+        if board == DEFAULT_BOARD:
+            raise ValueError("The default board can't be deleted")
+        os.remove(self.board_path(board))
+
+    # Saving
+
+    def attach(self, snapshot):
+        """Sets the callable that returns the data to save and starts the writer thread.
+
+        The data names the board it belongs to under "board", so a write that
+        races a board switch still lands in the right file.
+        """
+        self.snapshot = snapshot
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="store-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def mark_dirty(self):
+        """Records that the data changed; the write happens later on the writer thread."""
+        with self._condition:
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_mark = now
+            self.marks += 1
+            self._condition.notify()
+
+    def flush(self):
+        """Writes any pending changes now, on the calling thread."""
+        with self._condition:
+            if self._dirty_since is None:
+                return
+            marks = self.marks
+        # The flag is cleared only once the snapshot is taken: a flush that
+        # runs while another is waiting for the snapshot must still write
+        data = self.snapshot()
+        with self._condition:
+            # Changes marked meanwhile may be missing from the snapshot; the next flush saves them
+            if self.marks == marks:
+                self._dirty_since = None
+        self.write(data, data.pop("board", DEFAULT_BOARD))
+
+    def close(self):
+        """Flushes pending changes and stops the writer thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self.snapshot is not None:
+            self.flush()
+
+    def write(self, data, board=DEFAULT_BOARD):
+        """Atomically replaces a board's file with the given sections."""
+        document = dict(data, version=STORE_VERSION)
+        path = self.board_path(board)
+        temp_path = path + ".tmp"
+        with self._write_lock:
+            with open(temp_path, "w") as f:
+                json.dump(document, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+            self.flushes += 1
+
+    def stats(self):
+        return {"marks": self.marks, "flushes": self.flushes, "dirty": self._dirty_since is not None}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._dirty_since is None:
+                        self._condition.wait()
+                        continue
+                    deadline = min(self._last_mark + self.flush_delay, self._dirty_since + MAX_FLUSH_DELAY)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except (OSError, TypeError, ValueError) as e:
+                if self.on_error is not None:
+                    self.on_error("Save Error", f"Could not save the soundboard: {e}")
+                else:
+                    print(f"Could not save the soundboard: {e}")
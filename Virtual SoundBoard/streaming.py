@@ -0,0 +1,194 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from errors import ReportsErrors
+from importer import estimate_duration
+from lazy import LazyModule
+
+pygame = LazyModule("pygame")
+
+
+# Per-tile playback modes
+AUTO = "auto"            # decide from the file's length
+RESIDENT = "resident"    # decode fully into the sample cache; instant retriggers
+STREAM = "stream"        # decode while playing through pygame.mixer.music
+PLAYBACK_MODES = (AUTO, RESIDENT, STREAM)
+
+# Files at least this long, or this big once decoded, are streamed in AUTO mode
+STREAM_MIN_SECONDS = 10.0
+STREAM_MIN_PCM_BYTES = 8 * 1024 * 1024
+# Used when a file's length can't be read from its headers
+STREAM_MIN_FILE_BYTES = 1024 * 1024
+
+# Memory budget for read-ahead buffers of streamed files (compressed bytes)
+DEFAULT_READ_AHEAD_BYTES = 32 * 1024 * 1024
+
+
+class StreamPlayer(ReportsErrors):
+    """Plays long tracks through pygame.mixer.music without decoding them into RAM.
+
+    Streamed files are read ahead into memory in their compressed form, so the
+    decoder never waits on the disk while short clips fire on top. pygame has
+    a single music stream, so starting a streamed tile replaces the one that
+    is playing.
+    """
+
+    def __init__(self, read_ahead_bytes=DEFAULT_READ_AHEAD_BYTES, min_seconds=STREAM_MIN_SECONDS, min_pcm_bytes=STREAM_MIN_PCM_BYTES):
+        self.read_ahead_bytes = read_ahead_bytes
+        self.min_seconds = min_seconds
+        self.min_pcm_bytes = min_pcm_bytes
+        self.master_volume = 1.0
+        self.gain = 1.0
+        self.current = None
+        self.starts = 0
+        self.buffer_hits = 0
+        self.buffer_misses = 0
+        self.used_bytes = 0
+        # path -> (key, data), oldest first
+        self._buffers = OrderedDict()
+        # path -> (key, mode) for AUTO decisions
+        self._modes = {}
+        # Paths that may be read ahead, or None for any; see retain()
+        self._scope = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(file_path):
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    # Choosing a mode
+
+    def mode_for(self, file_path):
+        """Returns RESIDENT or STREAM for a file from its length, reading only its headers."""
+        key = self.make_key(file_path)
+        cached = self._modes.get(key[0])
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            duration = estimate_duration(file_path)
+        except (OSError, ValueError, KeyError) as e:
+            self._report_error("File Error", f"Could not read the length of '{os.path.basename(file_path)}': {e}")
+            duration = None
+        mixer = pygame.mixer.get_init()
+        if duration is None:
+            mode = STREAM if key[2] >= STREAM_MIN_FILE_BYTES else RESIDENT
+        elif mixer is None:
+            # Without an open mixer the decoded size is unknown; decide from the length alone for now
+            return STREAM if duration >= self.min_seconds else RESIDENT
+        else:
+            frequency, sample_format, channels = mixer
+            pcm_bytes = duration * frequency * channels * (abs(sample_format) // 8)
+            mode = STREAM if duration >= self.min_seconds or pcm_bytes >= self.min_pcm_bytes else RESIDENT
+        self._modes[key[0]] = (key, mode)
+        return mode
+
+    # Read-ahead
+
+    def read_ahead(self, file_paths):
+        """Reads files into memory on a background thread and returns the thread."""
+        paths = [path for path in file_paths if path]
+
+        def worker():
+            for path in paths:
+                try:
+                    self._buffer(path)
+                except OSError as e:
+                    self._report_error("Read-Ahead Error", f"Could not read ahead '{os.path.basename(path)}': {e}")
+
+        thread = threading.Thread(target=worker, name="stream-read-ahead", daemon=True)
+        thread.start()
+        return thread
+
+    def _buffer(self, file_path):
+        key = self.make_key(file_path)
+        with self._lock:
+            entry = self._buffers.get(key[0])
+            if entry is not None and entry[0] == key:
+                self._buffers.move_to_end(key[0])
+                return entry[1]
+        with open(file_path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            old = self._buffers.pop(key[0], None)
+            if old is not None:
+                self.used_bytes -= len(old[1])
+            if len(data) <= self.read_ahead_bytes and (self._scope is None or key[0] in self._scope):
+                self._buffers[key[0]] = (key, data)
+                self.used_bytes += len(data)
+                while self.used_bytes > self.read_ahead_bytes:
+                    _, (_, evicted) = self._buffers.popitem(last=False)
+                    self.used_bytes -= len(evicted)
+        return data
+
+    def invalidate(self, file_path):
+        with self._lock:
+            path = os.path.abspath(file_path)
+            entry = self._buffers.pop(path, None)
+            if entry is not None:
+                self.used_bytes -= len(entry[1])
+            self._modes.pop(path, None)
+
+    def retain(self, file_paths):
+        """Limits read-ahead to these files and drops the buffers of all others."""
+        keep = {os.path.abspath(path) for path in file_paths if path}
+        with self._lock:
+            self._scope = keep
+            for path in [path for path in self._buffers if path not in keep]:
+                self.used_bytes -= len(self._buffers.pop(path)[1])
+
+    def admit(self, file_paths):
+        """Adds files to the set retain() limited read-ahead to."""
+        with self._lock:
+            if self._scope is not None:
+                self._scope.update(os.path.abspath(path) for path in file_paths if path)
+
+    # Playback
+
+    def play(self, file_path, gain=1.0, start=0.0, fade_in=0.0):
+        """Starts streaming a file `start` seconds in, replacing whatever was streaming."""
+        key = self.make_key(file_path)
+        with self._lock:
+            entry = self._buffers.get(key[0])
+            data = entry[1] if entry is not None and entry[0] == key else None
+        if data is not None:
+            self.buffer_hits += 1
+            pygame.mixer.music.load(io.BytesIO(data), os.path.splitext(file_path)[1].lstrip("."))
+        else:
+            # Let the decoder read from disk this time and buffer it for the next trigger
+            self.buffer_misses += 1
+            pygame.mixer.music.load(file_path)
+            self.read_ahead([file_path])
+        self.gain = gain
+        pygame.mixer.music.set_volume(gain * self.master_volume)
+        pygame.mixer.music.play(start=start, fade_ms=round(fade_in * 1000))
+        self.current = file_path
+        self.starts += 1
+
+    def is_playing(self):
+        return self.current is not None and pygame.mixer.music.get_busy()
+
+    def stop(self):
+        if self.current is not None:
+            pygame.mixer.music.stop()
+            pygame.mixer.music.unload()
+            self.current = None
+
+    def set_master_volume(self, volume):
+        self.master_volume = float(volume)
+        pygame.mixer.music.set_volume(self.gain * self.master_volume)
+
+    def stats(self):
+        """Returns read-ahead memory use and stream counters as a dict."""
+        with self._lock:
+            return {
+                "buffers": len(self._buffers),
+                "used_bytes": self.used_bytes,
+                "budget_bytes": self.read_ahead_bytes,
+                "hits": self.buffer_hits,
+                "misses": self.buffer_misses,
+                "starts": self.starts,
+                "playing": self.current if self.is_playing() else None,
+            }
@@ -0,0 +1,339 @@
+import math
+import time
+import warnings
+
+import customtkinter as ctk
+
+from metrics import METRICS
+
+# Resize work is coalesced to at most once per frame
+FRAME_DELAY_MS = 16
+MIN_TILE_SIZE = 40
+KEY_LABEL_HEIGHT = 24
+TILE_PADDING = 10
+WAVEFORM_MARGIN = 16
+
+# Marker for the grid cell that shows the "New" tile
+NEW_SLOT = object()
+
+
+class TileGrid:
+    """Scrollable grid of sound tiles that only creates widgets for the visible rows.
+
+    Slot 0 is the "New" tile and sound tiles follow in library order. The
+    grid keeps a pool of button/label cells sized to the viewport and, when
+    the library changes or the view scrolls, re-configures only the cells
+    whose content changed.
+    """
+
+    def __init__(self, parent, names, num_columns, tile_style, new_tile_style, fg_color, text_color,
+                 key_text, on_trigger, on_context_menu, on_new, on_new_context_menu, waveform=None):
+        self.num_columns = num_columns
+        self.tile_style = tile_style
+        self.text_color = text_color
+        self.key_text = key_text
+        # waveform(name, width, height) returns an image for a tile, or None
+        self.waveform = waveform
+        self.on_trigger = on_trigger
+        self.on_context_menu = on_context_menu
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        self.container = ctk.CTkFrame(parent, fg_color=fg_color)
+        self.viewport = ctk.CTkFrame(self.container, fg_color=fg_color)
+        self.viewport.pack(side="left", fill="both", expand=True)
+        # The viewport's size comes from the window, not from the tiles inside it
+        self.viewport.grid_propagate(False)
+        self.viewport.grid_columnconfigure(list(range(num_columns)), weight=1)
+        self.scrollbar = ctk.CTkScrollbar(self.container, command=self.on_scrollbar)
+        self.scrollbar_shown = False
+
+        self.font = ctk.CTkFont(size=12, weight="bold")
+        self.key_font = ctk.CTkFont(size=10)
+        self.new_button = ctk.CTkButton(self.viewport, text="New", compound="top", font=self.font, command=on_new, **new_tile_style)
+        self.new_button.bind("<Button-3>", on_new_context_menu)
+        self.new_label = ctk.CTkLabel(self.viewport, text="", text_color=text_color, font=self.key_font)
+        self.new_cell = None  # cell index the "New" tile is shown in, if visible
+
+        self.cells = []       # pooled (button, label) pairs in row-major order
+        self.cell_names = []  # what each cell shows: a name, NEW_SLOT or None
+        self.cell_images = []  # waveform shown by each cell; Tk drops images Python no longer references
+        self.cell_image_labels = []  # CTk's image label inside each cell's button, once bound
+        self.first_row = 0
+        self.visible_rows = 0
+        self.tile_size = tile_style["width"]
+        self._resize_pending = None
+
+        for widget in (self.viewport, self.new_button):
+            self._bind_scroll(widget)
+        self.viewport.bind("<Configure>", self.schedule_resize)
+        self._apply_resize()
+
+    # Public API used by the app
+
+    def pack(self, **kwargs):
+        self.container.pack(**kwargs)
+
+    def insert(self, name):
+        """Adds a tile at the end of the grid."""
+        self.index[name] = len(self.names)
+        self.names.append(name)
+        self.render(self.cell_for_slot(len(self.names)))
+        self.update_scrollbar()
+
+    def extend(self, names):
+        """Adds several tiles at the end with a single render pass."""
+        first_slot = len(self.names) + 1
+        for name in names:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        self.render(self.cell_for_slot(first_slot))
+        self.update_scrollbar()
+
+    def set_names(self, names):
+        """Replaces every tile, e.g. when another board is opened, and scrolls back to the top."""
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.first_row = 0
+        self.render(force=True)
+        self.update_scrollbar()
+
+    def remove(self, name):
+        """Removes a tile; only the visible cells after it are re-rendered."""
+        position = self.index.pop(name)
+        del self.names[position]
+        for i in range(position, len(self.names)):
+            self.index[self.names[i]] = i
+        self.scroll_to(self.first_row)
+        self.render(self.cell_for_slot(position + 1))
+        self.update_scrollbar()
+
+    def rename(self, old_name, new_name):
+        position = self.index.pop(old_name)
+        self.names[position] = new_name
+        self.index[new_name] = position
+        self.render(self.cell_for_slot(position + 1), stop=self.cell_for_slot(position + 1) + 1)
+
+    def refresh(self, name=None):
+        """Re-reads the key label and waveform for one tile, or for every visible tile."""
+        if name is None:
+            self.render(force=True)
+            return
+        if name in self.index:
+            cell = self.cell_for_slot(self.index[name] + 1)
+            self.render(cell, stop=cell + 1, force=True)
+
+    def layout(self):
+        """Re-applies size and content to every visible cell."""
+        start = time.perf_counter()
+        self._apply_size(self.tile_size)
+        self.render(force=True)
+        self.update_scrollbar()
+        METRICS.observe("regrid", time.perf_counter() - start)
+
+    def widgets_for(self, name):
+        """Returns the (button, label) showing a tile, or None if it is scrolled out of view."""
+        if name not in self.index:
+            return None
+        cell = self.cell_for_slot(self.index[name] + 1)
+        if 0 <= cell < len(self.cells):
+            return self.cells[cell]
+        return None
+
+    # Rendering
+
+    def cell_for_slot(self, slot):
+        """Maps a grid slot to a pooled cell index (may be outside the pool)."""
+        return slot - self.first_row * self.num_columns
+
+    def slot_content(self, cell):
+        slot = self.first_row * self.num_columns + cell
+        if slot == 0:
+            return NEW_SLOT
+        if slot - 1 < len(self.names):
+            return self.names[slot - 1]
+        return None
+
+    def render(self, start=0, stop=None, force=False):
+        """Brings cells [start, stop) in line with the grid's content."""
+        start = max(0, start)
+        stop = len(self.cells) if stop is None else min(stop, len(self.cells))
+        for cell in range(start, stop):
+            content = self.slot_content(cell)
+            previous = self.cell_names[cell]
+            if content == previous and not force:
+                continue
+            button, label = self.cells[cell]
+            self.cell_names[cell] = content
+            if content is NEW_SLOT or content is None:
+                if previous not in (NEW_SLOT, None):
+                    button.grid_remove()
+                    label.grid_remove()
+                if content is NEW_SLOT:
+                    self._place_new(cell)
+                continue
+            if previous in (NEW_SLOT, None):
+                button.grid()
+                label.grid()
+            self._set_image(cell, button, self._waveform_for(cell, content))
+            button.configure(text=content)
+            label.configure(text=self.key_text(content))
+        if self.new_cell is not None and self.slot_content(self.new_cell) is not NEW_SLOT:
+            self.new_button.grid_remove()
+            self.new_label.grid_remove()
+            self.new_cell = None
+
+    def _waveform_for(self, cell, name):
+        image = None
+        if self.waveform is not None:
+            # Tile sizes are in CTk units; the image is drawn in screen pixels so it stays sharp on HiDPI
+            scaling = ctk.ScalingTracker.get_widget_scaling(self.viewport)
+            width = max(1, round((self.tile_size - WAVEFORM_MARGIN) * scaling))
+            height = max(1, round(self.tile_size // 3 * scaling))
+            image = self.waveform(name, width, height)
+        self.cell_images[cell] = image
+        return image
+
+    def _set_image(self, cell, button, image):
+        with warnings.catch_warnings():
+            # Waveforms are plain Tk photo images so drawing them doesn't need Pillow;
+            # they are drawn at the tile's pixel size instead of being scaled by CTk
+            warnings.filterwarnings("ignore", message=".*is not CTkImage.*")
+            button.configure(image=image)
+        if image is None and button._image_label is not None:
+            # CTk only drops its image label on a redraw, so without this the old waveform stays
+            button._draw()
+        label = button._image_label
+        if label is not None and label is not self.cell_image_labels[cell]:
+            # CTkButton.bind() only reaches child widgets that already existed,
+            # and the image label is created with the first waveform
+            label.bind("<Button-3>", lambda event: self._on_right_click(event, cell))
+            self._bind_scroll(label)
+        self.cell_image_labels[cell] = label
+
+    def _place_new(self, cell):
+        row, column = divmod(cell, self.num_columns)
+        self.new_button.grid(row=row * 2, column=column, padx=5, pady=5, sticky="nsew")
+        self.new_label.grid(row=row * 2 + 1, column=column, padx=5, pady=(0, 5), sticky="ew")
+        self.new_cell = cell
+
+    def _make_cell(self, cell):
+        row, column = divmod(cell, self.num_columns)
+        style = dict(self.tile_style, width=self.tile_size, height=self.tile_size)
+        button = ctk.CTkButton(self.viewport, text="", compound="top", font=self.font, command=lambda: self._on_click(cell), **style)
+        button.bind("<Button-3>", lambda event: self._on_right_click(event, cell))
+        self._bind_scroll(button)
+        label = ctk.CTkLabel(self.viewport, text="", text_color=self.text_color, font=self.key_font)
+        button.grid(row=row * 2, column=column, padx=5, pady=5, sticky="nsew")
+        label.grid(row=row * 2 + 1, column=column, padx=5, pady=(0, 5), sticky="ew")
+        # Cells start hidden; render() shows the ones that have content
+        button.grid_remove()
+        label.grid_remove()
+        return button, label
+
+    def _ensure_pool(self, rows):
+        wanted = rows * self.num_columns
+        while len(self.cells) < wanted:
+            self.cells.append(self._make_cell(len(self.cells)))
+            self.cell_names.append(None)
+            self.cell_images.append(None)
+            self.cell_image_labels.append(None)
+        while len(self.cells) > wanted:
+            button, label = self.cells.pop()
+            self.cell_images.pop()
+            self.cell_image_labels.pop()
+            if self.cell_names.pop() is NEW_SLOT:
+                self.new_button.grid_remove()
+                self.new_label.grid_remove()
+                self.new_cell = None
+            button.destroy()
+            label.destroy()
+
+    def _on_click(self, cell):
+        name = self.cell_names[cell]
+        if name is not None and name is not NEW_SLOT:
+            self.on_trigger(name)
+
+    def _on_right_click(self, event, cell):
+        name = self.cell_names[cell]
+        if name is not None and name is not NEW_SLOT:
+            self.on_context_menu(event, name)
+
+    # Resizing
+
+    def schedule_resize(self, event=None):
+        """Coalesces resize events so the layout is recomputed at most once per frame."""
+        if self._resize_pending is None:
+            self._resize_pending = self.viewport.after(FRAME_DELAY_MS, self._apply_resize)
+
+    def _apply_resize(self):
+        start = time.perf_counter()
+        self._resize()
+        METRICS.observe("resize", time.perf_counter() - start)
+
+    def _resize(self):
+        self._resize_pending = None
+        tile_size = max(MIN_TILE_SIZE, (self.viewport.winfo_width() - 20) // self.num_columns)
+        row_height = tile_size + KEY_LABEL_HEIGHT + TILE_PADDING
+        visible_rows = max(1, self.viewport.winfo_height() // row_height)
+        if tile_size == self.tile_size and visible_rows == self.visible_rows:
+            return
+        if tile_size != self.tile_size:
+            self._apply_size(tile_size)
+            if self.waveform is not None:
+                self.render(force=True)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self._ensure_pool(visible_rows)
+            self.scroll_to(self.first_row, force=True)
+        self.update_scrollbar()
+
+    def _apply_size(self, tile_size):
+        self.tile_size = tile_size
+        self.new_button.configure(width=tile_size, height=tile_size)
+        for button, _ in self.cells:
+            button.configure(width=tile_size, height=tile_size)
+
+    # Scrolling
+
+    def total_rows(self):
+        return math.ceil((len(self.names) + 1) / self.num_columns)
+
+    def scroll_to(self, row, force=False):
+        row = max(0, min(row, self.total_rows() - self.visible_rows))
+        if row == self.first_row and not force:
+            return
+        self.first_row = row
+        self.render()
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = self.total_rows()
+        if total <= self.visible_rows:
+            if self.scrollbar_shown:
+                self.scrollbar.pack_forget()
+                self.scrollbar_shown = False
+            return
+        if not self.scrollbar_shown:
+            self.scrollbar.pack(side="right", fill="y")
+            self.scrollbar_shown = True
+        self.scrollbar.set(self.first_row / total, (self.first_row + self.visible_rows) / total)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * self.total_rows()))
+        elif unit == "pages":
+            self.scroll_to(self.first_row + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.first_row + int(amount))
+
+    def on_mousewheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_to(self.first_row - 1)
+        else:
+            self.scroll_to(self.first_row + 1)
+
+    def _bind_scroll(self, widget):
+        widget.bind("<MouseWheel>", self.on_mousewheel)
+        widget.bind("<Button-4>", self.on_mousewheel)
+        widget.bind("<Button-5>", self.on_mousewheel)
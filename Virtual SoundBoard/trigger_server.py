@@ -0,0 +1,191 @@
+"""Local trigger API for the soundboard engine.
+
+Clients connect over localhost TCP (or a Unix socket) and send one JSON
+document per line. A document is either a single command or a list of
+commands that are executed as one batch:
+
+    {"cmd": "trigger", "name": "raze-fire-in-the-hole"}
+    [{"cmd": "stop"}, {"cmd": "volume", "value": 0.8}]
+    {"cmd": "bank", "name": "memes"}
+    {"cmd": "board", "name": "music beds"}
+
+Each line gets a one-line JSON reply with a result per command.
+"""
+import asyncio
+import argparse
+import json
+import os
+import threading
+
+from metrics import MetricsExporter, FORMATS, JSON, DEFAULT_EXPORT_INTERVAL, parse_address
+from store import DEFAULT_BOARD
+from voice_engine import DEFAULT_MAX_VOICES, STEAL_OLDEST, STEAL_POLICIES
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class TriggerServer:
+    """Serves batched trigger/stop/volume commands for a SoundBoardEngine."""
+
+    def __init__(self, engine, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._clients = set()
+
+    def execute(self, command):
+        """Runs one command against the engine and returns its result."""
+        cmd = command.get("cmd")
+        if cmd == "trigger":
+            name = command.get("name")
+            if not isinstance(name, str) or not name:
+                return {"ok": False, "error": "missing tile name"}
+            if self.engine.trigger(name):
+                return {"ok": True}
+            if name not in self.engine.sounds:
+                return {"ok": False, "error": f"unknown tile '{name}'"}
+            # Playback errors also go to the engine's error handlers
+            return {"ok": False, "error": f"could not play '{name}'"}
+        if cmd == "stop":
+            self.engine.stop_all()
+            return {"ok": True}
+        if cmd == "volume":
+            self.engine.set_volume(command["value"])
+            return {"ok": True}
+        if cmd == "bank":
+            self.engine.switch_bank(command.get("name") or "")
+            return {"ok": True}
+        if cmd == "board":
+            self.engine.switch_board(command["name"])
+            return {"ok": True}
+        if cmd == "stats":
+            return {"ok": True, "stats": self.engine.stats()}
+        return {"ok": False, "error": f"unknown command '{cmd}'"}
+
+    def execute_line(self, line):
+        """Parses one request line and returns the reply document."""
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            return {"ok": False, "error": f"invalid JSON: {e}"}
+        commands = request if isinstance(request, list) else [request]
+        results = []
+        for command in commands:
+            if not isinstance(command, dict):
+                results.append({"ok": False, "error": f"a command must be a JSON object, not {json.dumps(command)}"})
+                continue
+            try:
+                results.append(self.execute(command))
+            except (KeyError, TypeError, ValueError) as e:
+                results.append({"ok": False, "error": str(e)})
+        return {"ok": all(result["ok"] for result in results), "results": results}
+
+    async def _handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                reply = self.execute_line(line)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    async def start(self):
+        """Starts listening on the running event loop."""
+        if self.unix_path:
+            if os.path.exists(self.unix_path):
+                os.remove(self.unix_path)
+            self._server = await asyncio.start_unix_server(self._handle_client, path=self.unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self):
+        """Runs the server on its own event loop in a daemon thread."""
+        ready = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            loop.run_until_complete(self.start())
+            ready.set()
+            loop.run_forever()
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="trigger-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self._thread
+
+    def stop(self):
+        """Stops a server started with start_in_thread."""
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for task in list(self._clients):
+                task.cancel()
+            await asyncio.gather(*self._clients, return_exceptions=True)
+            await self._server.wait_closed()
+            asyncio.get_running_loop().stop()
+
+        loop = self._loop
+        self._loop = None
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the soundboard engine headless behind the local trigger API.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", dest="unix_path", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--data-dir", default=".", help="directory holding sounds.json and key_bindings.json")
+    parser.add_argument("--board", default=DEFAULT_BOARD, help="board to open")
+    parser.add_argument("--max-voices", type=int, default=DEFAULT_MAX_VOICES, help="sounds that can play at once")
+    parser.add_argument("--steal-policy", choices=STEAL_POLICIES, default=STEAL_OLDEST, help="which sound to cut when every voice is busy")
+    parser.add_argument("--record", metavar="JOURNAL", help="record triggers, stops and volume changes to this file for replay.py")
+    parser.add_argument("--metrics-file", help="write metrics snapshots to this file")
+    parser.add_argument("--metrics-socket", metavar="HOST:PORT", help="send metrics snapshots to a TCP listener")
+    parser.add_argument("--metrics-format", choices=FORMATS, default=JSON, help="format of exported metrics snapshots")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_EXPORT_INTERVAL, help="seconds between exported snapshots")
+    args = parser.parse_args()
+
+    import pygame
+    from engine import SoundBoardEngine
+
+    pygame.mixer.init()
+    engine = SoundBoardEngine(args.data_dir, board=args.board, max_voices=args.max_voices, steal_policy=args.steal_policy)
+    engine.preload()
+    if args.record:
+        engine.journal.start(args.record)
+    if args.metrics_file or args.metrics_socket:
+        address = parse_address(args.metrics_socket) if args.metrics_socket else None
+        MetricsExporter(engine.stats, args.metrics_file, address, args.metrics_interval, args.metrics_format).start()
+    server = TriggerServer(engine, args.host, args.port, args.unix_path)
+    print(f"Trigger server listening on {args.unix_path or f'{args.host}:{args.port}'}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
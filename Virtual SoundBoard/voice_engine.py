@@ -0,0 +1,123 @@
+import time
+
+from lazy import LazyModule
+
+pygame = LazyModule("pygame")
+
+
+# Per-tile trigger policies
+RETRIGGER = "retrigger"  # restart the tile if it is already playing
+OVERLAP = "overlap"      # start another voice on top of any playing ones
+CHOKE = "choke"          # silence every other voice in the same choke group
+POLICIES = (RETRIGGER, OVERLAP, CHOKE)
+
+# Voice-stealing policies used when every channel is busy
+STEAL_OLDEST = "oldest"
+STEAL_QUIETEST = "quietest"
+STEAL_LOWEST_PRIORITY = "lowest_priority"
+STEAL_POLICIES = (STEAL_OLDEST, STEAL_QUIETEST, STEAL_LOWEST_PRIORITY)
+
+DEFAULT_MAX_VOICES = 16
+
+
+class Voice:
+    """A sound currently playing on one mixer channel."""
+
+    def __init__(self, channel, key, gain, priority, choke_group):
+        self.channel = channel
+        self.key = key
+        self.gain = gain
+        self.priority = priority
+        self.choke_group = choke_group
+        self.started_at = time.monotonic()
+
+
+class VoiceEngine:
+    """Plays overlapping sounds on a fixed pool of pygame mixer channels."""
+
+    def __init__(self, max_voices=DEFAULT_MAX_VOICES, steal_policy=STEAL_OLDEST):
+        if steal_policy not in STEAL_POLICIES:
+            raise ValueError(f"Unknown voice-stealing policy '{steal_policy}'")
+        pygame.mixer.set_num_channels(max_voices)
+        self.max_voices = max_voices
+        self.steal_policy = steal_policy
+        self.master_volume = 1.0
+        self.channels = [pygame.mixer.Channel(i) for i in range(max_voices)]
+        self.voices = {}  # channel index -> Voice
+        self.triggers = 0
+        self.steals = 0
+        self.peak_voices = 0
+
+    def play(self, sound, key, policy=OVERLAP, choke_group=None, priority=0, gain=1.0):
+        """Starts a voice for a sound and returns it."""
+        self._reap()
+        if policy == RETRIGGER:
+            self.stop_matching(lambda voice: voice.key == key)
+        elif policy == CHOKE and choke_group is not None:
+            self.stop_matching(lambda voice: voice.choke_group == choke_group)
+
+        index = self._free_channel()
+        if index is None:
+            index = self._steal()
+        channel = self.channels[index]
+        voice = Voice(channel, key, gain, priority, choke_group)
+        channel.set_volume(gain * self.master_volume)
+        channel.play(sound)
+        self.voices[index] = voice
+        self.triggers += 1
+        self.peak_voices = max(self.peak_voices, len(self.voices))
+        return voice
+
+    def stop_matching(self, predicate):
+        """Stops every active voice the predicate accepts."""
+        for index, voice in list(self.voices.items()):
+            if predicate(voice):
+                voice.channel.stop()
+                del self.voices[index]
+
+    def stop_all(self):
+        for voice in self.voices.values():
+            voice.channel.stop()
+        self.voices.clear()
+
+    def set_master_volume(self, volume):
+        """Sets the master volume and applies it to every active voice."""
+        self.master_volume = float(volume)
+        for voice in self.voices.values():
+            voice.channel.set_volume(voice.gain * self.master_volume)
+
+    def active_voice_count(self):
+        self._reap()
+        return len(self.voices)
+
+    def stats(self):
+        """Returns voice counters so the pool can be sized for the load."""
+        return {
+            "max_voices": self.max_voices,
+            "active_voices": self.active_voice_count(),
+            "peak_voices": self.peak_voices,
+            "triggers": self.triggers,
+            "steals": self.steals,
+        }
+
+    def _reap(self):
+        for index, voice in list(self.voices.items()):
+            if not voice.channel.get_busy():
+                del self.voices[index]
+
+    def _free_channel(self):
+        for index in range(self.max_voices):
+            if index not in self.voices:
+                return index
+        return None
+
+    def _steal(self):
+        if self.steal_policy == STEAL_QUIETEST:
+            victim = min(self.voices, key=lambda i: (self.voices[i].gain, self.voices[i].started_at))
+        elif self.steal_policy == STEAL_LOWEST_PRIORITY:
+            victim = min(self.voices, key=lambda i: (self.voices[i].priority, self.voices[i].started_at))
+        else:
+            victim = min(self.voices, key=lambda i: self.voices[i].started_at)
+        self.voices.pop(victim).channel.stop()
+        self.steals += 1
+        return victim